@@ -9,47 +9,58 @@ import traceback
 import pandas as pd
 import matplotlib.pyplot as plt
 
-from os.path import splitext
+from os.path import splitext, isdir
 from math import floor, ceil
 from pandas.io.json import json_normalize
 
 # local imports
-from plot import plot, mkPlotConfig, prependErr
+from plot import plot, mkPlotConfig, prependErr, KINDS
+from chunked import loadChunked
+from store import loadStore
+from validate import validate
 
 
 def run():
     args = cli()
     try:
-        results = load(args.infile)
+        if isdir(args.infile):
+            results = loadStore(args.infile)
+        elif args.chunked:
+            results = loadChunked(args.infile, args.resolution, args.chunksize)
+        else:
+            results = load(args.infile, correctClocks=args.correct_clocks)
+            results["ledgers"] = secondsIndex(results["ledgers"])
     except Exception as e:
         print(prependErr("loading results file", e), file=sys.stderr)
         traceback.print_exc()
         sys.exit(1)
 
-    results["ledgers"].index = results["ledgers"].index.map(
-        lambda idx: (idx[0], idx[1], idx[2].total_seconds())
-    )
-    time = results["ledgers"].index.levels[2]
-    if args.prange is not None:
-        ti = floor(args.prange[0] * len(time))
-        tf = ceil(args.prange[1] * len(time)) - 1
-    elif args.trange is not None:
-        ti, tf = args.trange
-    else:
-        ti, tf = 0, len(time) - 1
-    trange = time[[ti, tf]]
+    try:
+        trange = getTRange(results["ledgers"], prange=args.prange, trange=args.trange)
+    except ValueError as e:
+        print(prependErr("getting time range", e), file=sys.stderr)
+        sys.exit(1)
 
-    plotCfg = mkPlotConfig(results["ledgers"], trange, results["params"], args.kind)
     try:
+        plotCfg = mkPlotConfig(
+            results["ledgers"],
+            trange,
+            results["params"],
+            args.kind,
+            grid=tuple(args.grid),
+            bins=args.bins,
+            drstats=results.get("drstats"),
+        )
         if args.save:
-            plotCfg["fbasename"] = f"{splitext(args.infile)[0]}-{args.kind}"
+            infile = args.infile.rstrip("/")
+            plotCfg["fbasename"] = f"{splitext(infile)[0]}-{args.kind}"
         else:
             plotCfg["fbasename"] = None
-        plot(results["ledgers"], trange, plotCfg)
+        # only keep every page open if they are going to be shown
+        plot(results["ledgers"], trange, plotCfg, keep=not args.no_show)
         if not args.no_show:
             plt.show()
-            plt.clf()
-            plt.close()
+            plt.close("all")
     except Exception as e:
         print(prependErr("plotting results", e), file=sys.stderr)
         traceback.print_exc()
@@ -82,10 +93,56 @@ def cli():
         "-k",
         "--kind",
         type=str,
-        choices=["all", "pairs"],
+        choices=KINDS,
         default="all",
         help="which kind of plot to make",
     )
+    parser.add_argument(
+        "-g",
+        "--grid",
+        nargs=2,
+        type=int,
+        default=[3, 2],
+        metavar=("ROWS", "COLS"),
+        help="maximum rows and columns of sub-plots per page for the pairs kind",
+    )
+    parser.add_argument(
+        "-b",
+        "--bins",
+        type=int,
+        default=500,
+        help="number of time buckets for the heatmap kind",
+    )
+    parser.add_argument(
+        "-c",
+        "--chunked",
+        action="store_true",
+        default=False,
+        help="load the results in chunks and plot a downsampled history, for "
+        "results that don't fit in memory",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=100000,
+        help="maximum number of ledger updates to process at once with "
+        "--chunked",
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        type=float,
+        default=1.0,
+        help="time resolution (in seconds) of the downsampled history with "
+        "--chunked",
+    )
+    parser.add_argument(
+        "--correct-clocks",
+        action="store_true",
+        default=False,
+        help="correct ledger update times for clock skew between the nodes, "
+        "as estimated from the transfers between them",
+    )
     parser.add_argument(
         "--no-show",
         action="store_true",
@@ -103,23 +160,28 @@ def cli():
         "infile",
         metavar="<results_file>",
         type=str,
-        help="json results file to load and plot",
+        help="json results file (or results store directory) to load and plot",
     )
     # fmt: on
     return parser.parse_args()
 
 
-def load(fname):
+def load(fname, correctClocks=False):
     """
     Load json results file into 3 dataframes:
         1.  uploads: Set of blocks uploaded by each peer.
         2.  dl_times: Each peers' downloaded times for the blocks they
             downloaded.
         3.  ledgers: The Bitswap ledger update ledgers for each peer.
+    The ledgers are checked for lost log lines and clock skew between the
+    nodes (see validate()).
     Input:
         -   fname (str): Path to json file to load.
+        -   correctClocks (bool): Whether to correct the ledger update times
+            for the nodes' estimated clock offsets.
     Returns:
-        A dictionary containing the above dataframes.
+        A dictionary containing the above dataframes, plus the results of the
+        validation.
     """
 
     with open(fname, "r") as jfile:
@@ -151,10 +213,12 @@ def load(fname):
         ]
     )
 
-    # use relative times for debt ratio update timestamps
-    ledgers["time"] = ledgers["time"].apply(pd.to_datetime)
+    # use relative times for debt ratio update timestamps (after correcting
+    # for clock skew, which can change which update was first)
+    ledgers["time"] = pd.to_datetime(ledgers["time"])
+    ledgers, validation = validate(ledgers, correctClocks=correctClocks)
     t0 = ledgers["time"].min()
-    ledgers["time"] = ledgers["time"].apply(lambda t: t - t0)
+    ledgers["time"] = ledgers["time"] - t0
     ledgers = ledgers.set_index(["id", "peer", "time"])
 
     return {
@@ -162,7 +226,57 @@ def load(fname):
         "uploads": uploads,
         "dl_times": dl_times,
         "ledgers": ledgers,
+        "validation": validation,
     }
 
 
-run()
+def secondsIndex(ledgers):
+    """
+    Convert the relative (timedelta) time level of the `ledgers` index as
+    returned by load() into seconds.
+    """
+    return ledgers.set_index(
+        ledgers.index.set_levels(ledgers.index.levels[2].total_seconds(), level=2)
+    )
+
+
+def getTRange(ledgers, prange=None, trange=None):
+    """
+    Get the time range to plot. At most one of `prange` and `trange` should be
+    set; if neither is, the full time range is used. Bounds outside of the
+    data are clamped to it. Raises ValueError if there are no ledger updates
+    in the range.
+
+    Inputs:
+        -   ledgers (pd.DataFrame): Ledgers with the time level in seconds
+            (see secondsIndex()).
+        -   prange ((float, float)): Lower and upper bounds as percentages of
+            the total time.
+        -   trange ((float, float)): Lower and upper bounds as literal time
+            values (in seconds).
+
+    Returns:
+        pd.Index: The lower and upper time values.
+    """
+
+    time = ledgers.index.levels[2]
+    if prange is not None:
+        ti = floor(prange[0] * len(time))
+        tf = ceil(prange[1] * len(time)) - 1
+    elif trange is not None:
+        ti = time.searchsorted(trange[0])
+        tf = time.searchsorted(trange[1], side="right") - 1
+    else:
+        ti, tf = 0, len(time) - 1
+    ti, tf = max(ti, 0), min(tf, len(time) - 1)
+    if ti > tf:
+        bounds = prange if prange is not None else trange
+        raise ValueError(
+            f"no ledger updates in time range {bounds} (data is from "
+            f"{time[0]} to {time[-1]})"
+        )
+    return time[[ti, tf]]
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import io
+import json
+import os
+import os.path
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+import traceback
+
+from datetime import datetime, timedelta, timezone
+
+import matplotlib
+
+# benchmarks never open a window (must happen before pyplot is imported by
+# the local modules)
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+# local imports
+from app import load, secondsIndex, getTRange  # noqa: E402
+from plot import iterPages, mkPlotConfig, savePages, prependErr  # noqa: E402
+
+# version of the baseline file format
+BASELINE_VERSION = 1
+DEFAULT_BASELINE = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "benchmarks",
+        "baseline.json",
+    )
+)
+
+# canonical workloads: every node exchanges data with every other node, with
+# `transfers` transfers between random pairs of nodes in total
+WORKLOADS = {
+    "mesh-10": {"nodes": 10, "transfers": 20000},
+    "mesh-50": {"nodes": 50, "transfers": 50000},
+    "mesh-100": {"nodes": 100, "transfers": 100000},
+}
+# plot kinds to benchmark. 'pairs' makes one sub-plot per pair, which would
+# dominate the run time of the larger workloads
+PLOT_KINDS = ["all", "heatmap", "summary"]
+# the fastest of fewer runs than this varied by up to 50% between
+# back-to-back runs on the same machine. with 3 runs, stages longer than 0.5s
+# varied by up to 20%, and shorter ones (whose differences are ignored up to
+# --min-time) by up to 0.07s
+MIN_REPEAT = 3
+
+
+def run():
+    args = cli()
+    try:
+        if args.cmd == "record":
+            results = benchWorkloads(args.workloads, args.repeat)
+            saveBaseline(results, args.repeat, args.baseline)
+            print(f"saved baseline to {args.baseline}")
+        elif args.cmd == "compare":
+            if not os.path.exists(args.baseline):
+                print(
+                    f"no baseline recorded at {args.baseline}; run "
+                    "`bench.py record` first",
+                    file=sys.stderr,
+                )
+                sys.exit(3)
+            baseline = loadBaseline(args.baseline)
+            workloads = args.workloads or list(baseline["workloads"])
+            results = benchWorkloads(workloads, args.repeat)
+            if args.output is not None:
+                saveBaseline(results, args.repeat, args.output)
+            regressions = compare(
+                baseline, results, args.tolerance, args.mem_tolerance, args.min_time
+            )
+            if regressions > 0:
+                print(f"{regressions} regression(s)", file=sys.stderr)
+                sys.exit(1)
+    except Exception as e:
+        print(prependErr("running benchmarks", e), file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(2)
+
+
+def cli():
+    """
+    Parse CLI args.
+    """
+    parser = argparse.ArgumentParser()
+    # fmt: off
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=str,
+        default=DEFAULT_BASELINE,
+        help="baseline json file",
+    )
+    # options shared by the commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "-w",
+        "--workloads",
+        nargs="+",
+        choices=list(WORKLOADS),
+        help="workloads to run (default: all for record, the baseline's for "
+        "compare)",
+    )
+    common.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=MIN_REPEAT,
+        help="number of timed runs of each stage (the fastest is kept)",
+    )
+    cmds = parser.add_subparsers(dest="cmd")
+    cmds.required = True
+    cmds.add_parser(
+        "record",
+        parents=[common],
+        help="run the workloads and save the results as the baseline",
+    )
+    compareCmd = cmds.add_parser(
+        "compare",
+        parents=[common],
+        help="run the workloads and fail if any stage regressed",
+        description="Run the workloads and compare them to the baseline. "
+        "Exits with 1 if any stage regressed, 2 on errors and 3 if no "
+        "baseline has been recorded.",
+    )
+    compareCmd.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative increase in run time (see MIN_REPEAT for the "
+        "noise between runs)",
+    )
+    compareCmd.add_argument(
+        "-m",
+        "--mem-tolerance",
+        type=float,
+        default=0.1,
+        help="allowed relative increase in peak memory",
+    )
+    compareCmd.add_argument(
+        "--min-time",
+        type=float,
+        default=0.1,
+        help="run time increases smaller than this (in seconds) are ignored",
+    )
+    compareCmd.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="also save the results of this run to this file",
+    )
+    # fmt: on
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.cmd == "compare" and args.repeat < MIN_REPEAT:
+        parser.error(
+            f"compare needs --repeat of at least {MIN_REPEAT}: the fastest of "
+            "fewer runs is too noisy to compare"
+        )
+    if args.cmd == "record" and args.workloads is None:
+        args.workloads = list(WORKLOADS)
+    return args
+
+
+def mkResults(nodes, transfers, seed=0):
+    """
+    Generate the results of a synthetic run in the format written by test.sh,
+    where each of `transfers` transfers is between a random pair of the
+    `nodes` nodes and is logged by both of them.
+    """
+
+    rng = random.Random(seed)
+    ids = [f"QmBenchNode{i:04d}" for i in range(nodes)]
+    start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+    history = [[] for _ in ids]
+    sent = {}
+    for k in range(transfers):
+        i, j = rng.sample(range(nodes), 2)
+        t = start + timedelta(milliseconds=10 * k)
+        sent[i, j] = sent.get((i, j), 0) + rng.randint(1, 2**18)
+        recv = sent.get((j, i), 0)
+        # the sender logs the transfer, and the receiver logs it 2ms later
+        for user, peer, s, r, dt in (
+            (i, j, sent[i, j], recv, 0),
+            (j, i, recv, sent[i, j], 2),
+        ):
+            history[user].append(
+                {
+                    "event": "Send" if user == i else "Receive",
+                    "peer": ids[peer],
+                    "time": (t + timedelta(milliseconds=dt)).isoformat(),
+                    "sent": s,
+                    "recv": r,
+                    "value": s / (r + 1),
+                }
+            )
+    return [
+        {
+            "id": nodeId,
+            "strategy": "identity",
+            "upload_bandwidth": "-1",
+            "round_burst": "10000",
+            # as written by tests/test-2.sh
+            "uploads": [{"cid": f"QmBenchFile{i:04d}"}],
+            "dl_times": [
+                {"block": f"QmBenchFile{j:04d}", "time": f"{rng.randint(1, 999)}ms"}
+                for j in range(nodes)
+                if j != i
+            ],
+            "history": history[i],
+        }
+        for i, nodeId in enumerate(ids)
+    ]
+
+
+def measure(fn, repeat):
+    """
+    Run `fn` `repeat` times and once more while tracing memory allocations.
+
+    Returns:
+        (dict, any): The fastest run time (in seconds) and the peak traced
+        memory (in MiB), and the return value of the last run.
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        out = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"time": best, "peak_mb": peak / 2**20}, out
+
+
+def benchWorkload(nodes, transfers, repeat):
+    """
+    Time the stages of the analysis pipeline (loading, configuring and
+    rendering each plot kind) on a synthetic workload.
+
+    Returns:
+        dict: The measurements of each stage, keyed by stage name.
+    """
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, "results.json")
+        with open(fname, "w") as jfile:
+            json.dump(mkResults(nodes, transfers), jfile)
+
+        def loadStage():
+            results = load(fname)
+            results["ledgers"] = secondsIndex(results["ledgers"])
+            return results
+
+        stages["load"], results = measure(loadStage, repeat)
+
+    ledgers = results["ledgers"]
+    trange = getTRange(ledgers)
+    for kind in PLOT_KINDS:
+
+        def cfgStage():
+            return mkPlotConfig(
+                ledgers, trange, results["params"], kind, fbasename=None
+            )
+
+        stages[f"mkPlotConfig-{kind}"], cfg = measure(cfgStage, repeat)
+
+        def plotStage():
+            try:
+                for log in (False, True):
+                    savePages(
+                        iterPages(ledgers, trange, cfg, log=log),
+                        io.BytesIO(),
+                        format="png",
+                        close=True,
+                    )
+            finally:
+                plt.close("all")
+
+        stages[f"plot-{kind}"], _ = measure(plotStage, repeat)
+
+    return stages
+
+
+def benchWorkloads(names, repeat):
+    """
+    Run the workloads in `names` (see WORKLOADS).
+    """
+    results = {}
+    for name in names:
+        print(f"running {name}...", file=sys.stderr)
+        results[name] = benchWorkload(repeat=repeat, **WORKLOADS[name])
+    return results
+
+
+def saveBaseline(results, repeat, fname):
+    jdata = {
+        "version": BASELINE_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "repeat": repeat,
+        "workloads": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    with open(fname, "w") as jfile:
+        json.dump(jdata, jfile, indent=2, sort_keys=True)
+        jfile.write("\n")
+
+
+def loadBaseline(fname):
+    with open(fname, "r") as jfile:
+        jdata = json.load(jfile)
+    if jdata.get("version") != BASELINE_VERSION:
+        raise ValueError(
+            f"{fname} has baseline version {jdata.get('version')}, expected "
+            f"{BASELINE_VERSION}; re-record it"
+        )
+    return jdata
+
+
+def compare(baseline, results, tolerance, memTolerance, minTime):
+    """
+    Print each stage's run time and peak memory next to the baseline's.
+
+    Inputs:
+        -   baseline (dict): Baseline, as returned by loadBaseline().
+        -   results (dict): Results of benchWorkloads().
+        -   tolerance (float): Allowed relative increase in run time.
+        -   memTolerance (float): Allowed relative increase in peak memory.
+        -   minTime (float): Run time increases smaller than this (in seconds)
+            are never regressions.
+
+    Returns:
+        int: The number of stages that regressed.
+    """
+
+    regressions = 0
+    for workload, stages in results.items():
+        for stage, new in stages.items():
+            old = baseline["workloads"].get(workload, {}).get(stage)
+            if old is None:
+                print(f"{workload:<10} {stage:<22} {new['time']:8.3f}s (no baseline)")
+                continue
+            slower = (
+                new["time"] > old["time"] * (1 + tolerance)
+                and new["time"] - old["time"] > minTime
+            )
+            bigger = new["peak_mb"] > old["peak_mb"] * (1 + memTolerance)
+            status = "REGRESSED" if slower or bigger else "ok"
+            regressions += status != "ok"
+            print(
+                f"{workload:<10} {stage:<22} "
+                f"{old['time']:8.3f}s -> {new['time']:8.3f}s "
+                f"({relChange(old['time'], new['time'])}), "
+                f"{old['peak_mb']:8.1f}MiB -> {new['peak_mb']:8.1f}MiB "
+                f"({relChange(old['peak_mb'], new['peak_mb'])})  {status}"
+            )
+    return regressions
+
+
+def relChange(old, new):
+    return f"{(new - old) / old:+.0%}" if old > 0 else "n/a"
+
+
+if __name__ == "__main__":
+    run()
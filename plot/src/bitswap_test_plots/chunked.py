@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+
+import pandas as pd
+
+from pandas.io.json import json_normalize
+
+EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+HISTORY_FIELDS = ["peer", "time", "sent", "recv", "value"]
+# columns of the per-pair value at the last time it was updated
+LAST_FIELDS = ["time", "sent", "recv", "value"]
+
+
+def loadChunked(fname, resolution=1.0, chunksize=100000):
+    """
+    Load json results file like load(), but without ever holding the full
+    ledger history in memory. The file is streamed one node at a time, and
+    each node's history is processed in chunks of at most `chunksize` ledger
+    updates. The chunks are reduced to:
+        1.  Summary statistics for every pair of peers (see aggregate()).
+        2.  A downsampled debt ratio history for every pair of peers, with
+            the last update in every `resolution` second time bucket.
+    Note: One node's (raw json) history still has to fit in memory.
+
+    Inputs:
+        -   fname (str): Path to json file to load.
+        -   resolution (float): Width of the time buckets, in seconds.
+        -   chunksize (int): Maximum number of ledger updates to process at
+            once.
+
+    Returns:
+        A dictionary containing the same keys as load(), where the ledgers
+        are the downsampled histories with their times in seconds (as
+        returned by secondsIndex()), plus:
+            -   stats (pd.DataFrame): The summary statistics.
+            -   drstats (dict): Minimum, maximum and mean debt ratio over
+                every ledger update.
+    """
+
+    meta = []
+    stats, series = [], []
+    for node in iterNodes(fname):
+        history = node.pop("history")
+        meta.append(node)
+        # combine the node's chunks once they're all aggregated, so that
+        # each partial result is only regrouped once
+        nodeStats, nodeSeries = [], []
+        for chunk in iterChunks(node["id"], history, chunksize):
+            s, d = aggregate(chunk, resolution)
+            nodeStats.append(s)
+            nodeSeries.append(d)
+        del history
+        if len(nodeStats) == 1:
+            stats.append(nodeStats[0])
+            series.append(nodeSeries[0])
+        elif len(nodeStats) > 1:
+            stats.append(combineStats(nodeStats))
+            series.append(combineSeries(nodeSeries))
+    if len(stats) == 0:
+        raise ValueError(f"no ledger history in {fname}")
+
+    # nodes' partial results are disjoint, so they only need to be stacked
+    stats = pd.concat(stats)
+    series = pd.concat(series)
+
+    return {
+        **metaFrames(meta),
+        "ledgers": relativeSeries(series, stats["first"].min()),
+        "stats": stats,
+        "drstats": drStats(stats),
+    }
+
+
+def metaFrames(meta):
+    """
+    Load the nodes' metadata (everything except their history) into the
+    params, uploads and dl_times dataframes as returned by load().
+    """
+    params = pd.DataFrame.from_records(
+        meta, exclude=["uploads", "dl_times"], index="id"
+    )
+    # start from empty frames so that the index columns exist even if no node
+    # has any uploads or download times
+    uploads = pd.concat(
+        [pd.DataFrame(columns=["id"])]
+        + [json_normalize(data=node, record_path="uploads", meta="id") for node in meta]
+    ).set_index("id")
+    dl_times = pd.concat(
+        [pd.DataFrame(columns=["id", "block"])]
+        + [
+            json_normalize(data=node, record_path="dl_times", meta="id")
+            for node in meta
+        ]
+    ).set_index(["id", "block"])
+    return {"params": params, "uploads": uploads, "dl_times": dl_times}
+
+
+def iterNodes(fname, blocksize=2**20):
+    """
+    Iterate over the nodes of a json results file (a list of objects, one per
+    node) without loading the whole file.
+    """
+
+    decoder = json.JSONDecoder()
+    with open(fname, "r") as jfile:
+        buf = jfile.read(blocksize).lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{fname} does not contain a json list")
+        buf = buf[1:]
+        eof = False
+        while True:
+            buf = buf.lstrip()
+            if buf.startswith(","):
+                buf = buf[1:].lstrip()
+            if buf.startswith("]"):
+                return
+            try:
+                node, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # the next node is incomplete. read (at least) as much again
+                # as is buffered so that large nodes are re-parsed a
+                # logarithmic number of times
+                more = jfile.read(max(blocksize, len(buf)))
+                eof = len(more) == 0
+                buf += more
+                continue
+            yield node
+            buf = buf[end:]
+
+
+def iterChunks(nodeId, history, chunksize):
+    """
+    Convert a node's ledger history into dataframes of at most `chunksize`
+    rows, with the columns id, peer, time (in nanoseconds since the epoch),
+    sent, recv and value.
+    """
+    for i in range(0, len(history), chunksize):
+        chunk = pd.DataFrame.from_records(
+            history[i : i + chunksize], columns=HISTORY_FIELDS
+        )
+        chunk.insert(0, "id", nodeId)
+        chunk["time"] = epochNanos(chunk["time"])
+        yield chunk
+
+
+def epochNanos(times):
+    """
+    Convert a series of timestamp strings into (integer) nanoseconds since the
+    epoch.
+    """
+    return (pd.to_datetime(times, utc=True) - EPOCH) // pd.Timedelta(1, unit="ns")
+
+
+def aggregate(chunk, resolution):
+    """
+    Reduce a chunk of ledger updates (see iterChunks()) to partial aggregates
+    that can be combined with those of other chunks.
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): The summary statistics, indexed by
+        (id, peer), with columns:
+            -   min, max, sum, count: Of the debt ratio values.
+            -   first: Time of the first update.
+            -   time, sent, recv, value: The last update.
+        and the downsampled history, indexed by (id, peer, bucket), where
+        bucket is the time of the update divided by `resolution` (in
+        seconds), with the last update in each bucket.
+    """
+
+    chunk = chunk.sort_values("time", kind="mergesort")
+    pairs = chunk.groupby(["id", "peer"], sort=False)
+    stats = pairs["value"].agg(["min", "max", "sum", "count"])
+    stats["first"] = pairs["time"].min()
+    stats = stats.join(pairs[LAST_FIELDS].last())
+
+    chunk["bucket"] = chunk["time"] // int(resolution * 1e9)
+    series = chunk.groupby(["id", "peer", "bucket"], sort=False)[LAST_FIELDS].last()
+
+    return stats, series
+
+
+def combineStats(partials):
+    """
+    Combine the summary statistics of several chunks (see aggregate()).
+    """
+    cat = pd.concat(partials)
+    pairs = cat.groupby(level=[0, 1], sort=False)
+    stats = pd.DataFrame(
+        {
+            "min": pairs["min"].min(),
+            "max": pairs["max"].max(),
+            "sum": pairs["sum"].sum(),
+            "count": pairs["count"].sum(),
+            "first": pairs["first"].min(),
+        }
+    )
+    last = (
+        cat[LAST_FIELDS]
+        .sort_values("time", kind="mergesort")
+        .groupby(level=[0, 1], sort=False)
+        .last()
+    )
+    return stats.join(last)
+
+
+def combineSeries(partials):
+    """
+    Combine the downsampled histories of several chunks (see aggregate()).
+    """
+    return (
+        pd.concat(partials)
+        .sort_values("time", kind="mergesort")
+        .groupby(level=[0, 1, 2], sort=False)
+        .last()
+    )
+
+
+def relativeSeries(series, t0):
+    """
+    Convert a downsampled history into a ledgers dataframe indexed by
+    (id, peer, time), with times in seconds relative to t0 (in nanoseconds
+    since the epoch).
+    """
+    ledgers = series.reset_index(level=2, drop=True)
+    ledgers["time"] = (ledgers["time"] - t0) / 1e9
+    return ledgers.set_index("time", append=True).sort_index()
+
+
+def drStats(stats):
+    """
+    Get the overall minimum, maximum and mean debt ratio from the summary
+    statistics.
+    """
+    return {
+        "min": stats["min"].min(),
+        "max": stats["max"].max(),
+        "mean": stats["sum"].sum() / stats["count"].sum(),
+    }
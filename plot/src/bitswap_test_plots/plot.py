@@ -4,11 +4,21 @@
 import sys
 import os.path
 
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
-from math import log10
+from copy import copy
+from math import ceil, log10
 from collections import OrderedDict
-from matplotlib import rcParams
+from matplotlib import (
+    rcParams,
+    colors as mcolors,
+    scale as mscale,
+    transforms as mtransforms,
+)
+from matplotlib.ticker import MaxNLocator
+from matplotlib.backends.backend_pdf import PdfPages
 
 plt.style.use("ggplot")
 rcParams.update({"figure.autolayout": True})
@@ -16,124 +26,162 @@ rcParams["axes.titlepad"] = 4
 rcParams["axes.xmargin"] = 0.1
 rcParams["axes.ymargin"] = 0.1
 
+# plot kinds supported by mkPlotConfig()
+KINDS = ["all", "pairs", "summary", "heatmap"]
 
-def plot(ledgers, trange, cfg):
+# (inner, outer) colors used when there are few enough pairs of peers
+COLOR_PAIRS = [("magenta", "black"), ("green", "orange"), ("blue", "red")]
+
+# axes with more legend entries than this are drawn without a legend
+MAX_LEGEND_ENTRIES = 12
+
+
+def plot(ledgers, trange, cfg, keep=True):
     """
     Plots debt ratios (stored in `ledgers`) from trange[0] to' trange[1].
-    The history time series is plotted as a curve where the y-axis is the
-    debt ratio value. Two concentric circles are plotted at trange[1] for
-    each pair of peers i, j, where the inner circle's radius represents the
-    amount of data j has sent to i and the outer radius represents the
-    amount of data i has sent to j.
+    For the 'all' and 'pairs' kinds, the history time series is plotted as a
+    curve where the y-axis is the debt ratio value. Two concentric circles are
+    plotted at the end of each curve for each pair of peers i, j, where the
+    inner circle's radius represents the amount of data j has sent to i and
+    the outer radius represents the amount of data i has sent to j. The
+    'summary' kind plots the last debt ratio of each pair in trange as a
+    user x peer heatmap, and the 'heatmap' kind plots the debt ratio of each
+    pair over time as a pair x time heatmap.
 
     Inputs:
         -   ledgers (pd.DataFrame)
         -   trange ((pd.Datetime, pd.Datetime)): Time range to plot
-        -   cfg (dict): Plot config. See getPlotConfig().
+        -   cfg (dict): Plot config. See mkPlotConfig().
+        -   keep (bool): Whether to keep the pages open (e.g. to show them).
+            Otherwise, each page is closed as soon as it is saved, so only
+            one page is open at a time.
+
+    Returns:
+        ([matplotlib.figure.Figure], [matplotlib.figure.Figure]): The pages of
+        the linear and semi-log plots, or empty lists if not `keep`.
     """
 
-    try:
-        fig, axes = mkAxes(
-            cfg["num_axes"], cfg["cycleLen"], cfg["title"], cfg["colors"]
-        )
-    except Exception as e:
-        raise prependErr("error configuring plot axes", e)
-    try:
-        figLog, axesLog = mkAxes(
-            cfg["num_axes"], cfg["cycleLen"], cfg["title"], cfg["colors"], log=True
-        )
-    except Exception as e:
-        raise prependErr("error configuring semi-log plot axes", e)
+    figs, figsLog = [], []
+    for log, out in ((False, figs), (True, figsLog)):
+        pages = iterPages(ledgers, trange, cfg, log=log)
+        if keep:
+            out.extend(pages)
+            pages = out
+        if cfg["fbasename"] is not None:
+            suffix = "-semilog" if log else ""
+            outfile = os.path.join(
+                cfg["fdir"], f"{cfg['fbasename']}{suffix}{cfg['fext']}"
+            )
+            savePages(pages, outfile, close=not keep)
+            print(f"saved {'log' if log else 'linear'} plot to {outfile}")
+
+    return figs, figsLog
+
+
+def iterPages(ledgers, trange, cfg, log=False, pages=None):
+    """
+    Make the pages of the linear or semi-log plot one at a time. See plot().
 
-    drstats = {
+    Inputs:
+        -   ledgers (pd.DataFrame)
+        -   trange ((pd.Datetime, pd.Datetime)): Time range to plot
+        -   cfg (dict): Plot config. See mkPlotConfig().
+        -   log (bool): Whether to make the semi-log plot.
+        -   pages ([int]): Indices of the pages to make (default: all of
+            them). See numPages().
+
+    Yields:
+        matplotlib.figure.Figure: Each page.
+    """
+
+    if cfg["kind"] == "summary":
+        yield plotSummary(ledgers, trange, cfg, log=log)
+    elif cfg["kind"] == "heatmap":
+        yield plotHeatmap(ledgers, trange, cfg, log=log)
+    else:
+        yield from plotHistory(ledgers, trange, cfg, log=log, pages=pages)
+
+
+def plotHistory(ledgers, trange, cfg, log=False, pages=None):
+    """
+    Plot the debt ratio time series of every pair of peers, on the axes given
+    by cfg["axisMap"]. Every page gets the axis limits that autoscaling all of
+    the data would give, so that pages can be drawn (and closed) one at a
+    time. See iterPages().
+    """
+
+    tmin, tmax = trange
+    drstats = cfg["drstats"] or {
         "min": ledgers["value"].min(),
         "max": ledgers["value"].max(),
         "mean": ledgers["value"].mean(),
     }
-    plotTRange(ledgers, trange, axes, axesLog, "curve", stats=drstats)
-    sent_max = ledgers["sent"].xs(trange[1], level=2).max().round()
-    plotTRange(
-        ledgers,
-        trange,
-        axes,
-        axesLog,
-        "dot",
-        colorMap=cfg["colorMap"],
-        sent_max=sent_max,
+    inRange = inTRange(ledgers, trange)
+    users = inRange.index.get_level_values(0)
+    peers = inRange.index.get_level_values(1)
+    inRange = inRange[users != peers]
+    sent_max = (
+        inRange["sent"].groupby(level=[0, 1]).last().max().round()
+        if len(inRange) > 0
+        else 0
     )
     try:
-        cfgAxes(axes)
+        xlim, ylim = axisLimits(inRange, log=log)
     except Exception as e:
-        raise prependErr("configuring axis post-plot", e)
-    try:
-        cfgAxes(axesLog, log=True, ymax=drstats["max"])
-    except Exception as e:
-        raise prependErr("configuring semi-log axis post-plot", e)
-
-    if cfg["fbasename"] is not None:
-        outfile = os.path.join(cfg["fdir"], f"{cfg['fbasename']}{cfg['fext']}")
-        fig.savefig(outfile, bbox_inches="tight")
-        print(f"saved linear plot to {outfile}")
-
-        outfileLog = os.path.join(
-            cfg["fdir"], f"{cfg['fbasename']}-semilog{cfg['fext']}"
-        )
-        figLog.savefig(outfileLog, bbox_inches="tight")
-        print(f"saved log plot to {outfileLog}")
-
+        raise prependErr("computing axis limits", e)
+
+    userNums = {user: i for i, user in enumerate(ledgers.index.levels[0])}
+    peerNums = {peer: j for j, peer in enumerate(ledgers.index.levels[1])}
+    if not log:
+        for user, peer in cfg["missing"]:
+            warn(
+                f"no data for peers {userNums[user]} ({user}) and "
+                f"{peerNums[peer]} ({peer}) in [{tmin}, {tmax}]"
+            )
 
-def plotTRange(ledgers, trange, axes, axesLog, kind, **kwargs):
+    # split the history by page once, rather than searching it for each page
+    perPage = pageLayout(cfg["num_axes"], cfg["grid"])[2]
+    onPage = {}
+    for (user, peer), p in inRange.groupby(level=[0, 1], sort=False):
+        # k is the index of the axis we should be plotting on
+        k = cfg["axisMap"][user, peer]
+        onPage.setdefault(k // perPage, []).append((user, peer, k, p.droplevel([0, 1])))
+
+    for page in range(numPages(cfg)) if pages is None else pages:
+        try:
+            (fig,), axes = mkAxes(
+                cfg["num_axes"],
+                cfg["grid"],
+                cfg["title"],
+                cfg["axisTitles"],
+                log=log,
+                pages=[page],
+            )
+        except Exception as e:
+            raise prependErr(f"configuring axes of page {page}", e)
+        history = onPage.get(page, [])
+        for user, peer, k, p in history:
+            i, j = userNums[user], peerNums[peer]
+            color = cfg["colorMap"][user, peer][0]
+            plotCurve(p, i, j, axes[k], color, stats=drstats)
+        # draw the dots after every curve so that no curve hides them
+        for user, peer, k, p in history:
+            plotDot(p, user, peer, axes[k], cfg["colorMap"], sent_max)
+        try:
+            cfgAxes(axes.values(), xlim, ylim, log=log)
+        except Exception as e:
+            raise prependErr(f"configuring axes of page {page} post-plot", e)
+        yield fig
+
+
+def plotCurve(p, i, j, ax, color, stats):
     """
-    Inputs:
-        -   ledgers (pd.DataFrame)
-        -   trange ((pd.Datetime, pd.Datetime)): Time range to plot
-        -   axes ([matplotlib.axes])
-        -   axesLog ([matplotlib.axes])
-        -   kind (str): Which plot to make. Possible values:
-            -   'curve': Plot the time series curve from trange[0] to
-                trange[1].
-            -   'dot': Plot the dot at trange[1].
-        -   kwargs (dict): Keyword arguments for wrapped plot functions.
+    Plot history as a curve.
     """
+    ax.plot(p.index, p["value"], color=color, label=f"Debt ratio of {j} wrt {i}")
 
-    tmin, tmax = trange
-    # k is the index of the axis we should be plotting on
-    k = 0
-    for i, user in enumerate(ledgers.index.levels[0]):
-        u = ledgers.loc[user]
-        ax = axes[k]
-        axLog = axesLog[k]
-        for j, peer in enumerate(u.index.levels[0]):
-            if user == peer:
-                continue
-            pall = u.loc[peer]
-            p = pall[(tmin <= pall.index) & (pall.index <= tmax)]
-
-            if kind == "curve":
-                if len(p) == 0:
-                    warn(
-                        f"no data for peers {i} ({user}) and {j} ({peer}) in "
-                        f"[{tmin}, {tmax}]"
-                    )
-                    continue
-                plotCurve(p, trange, i, j, ax, axLog, **kwargs)
-            elif kind == "dot":
-                if len(p) == 0:
-                    continue
-                plotDot(p, user, peer, ax, axLog, **kwargs)
-        k = (k + 1) % len(axes)
-
-
-def plotCurve(p, trange, i, j, ax, axLog, stats):
-    """
-    Plot history as a curve from trange[0] to trange[1].
-    """
-    xmin, xmax = trange
-    p.plot(y="value", ax=ax, label=f"Debt ratio of {j} wrt {i}")
-    p.plot(y="value", logy=True, ax=axLog, label=f"Debt ratio of {j} wrt {i}")
-
-
-def plotDot(p, user, peer, ax, axLog, colorMap, sent_max):
+
+def plotDot(p, user, peer, ax, colorMap, sent_max):
     """
     For a given user, peer pair, plot two concentric circles at the last time
     user updated their ledger for peer. The inner circle's radius corresponds
@@ -155,81 +203,372 @@ def plotDot(p, user, peer, ax, axLog, colorMap, sent_max):
     cInner, cOuter = colorMap[user, peer]
     ax.plot(t, d, color=cOuter, marker="o", markersize=ro, markeredgecolor="black")
     ax.plot(t, d, color=cInner, marker="o", markersize=ri, markeredgecolor="black")
-    axLog.plot(t, d, color=cOuter, marker="o", markersize=ro, markeredgecolor="black")
-    axLog.plot(t, d, color=cInner, marker="o", markersize=ri, markeredgecolor="black")
 
 
-def mkAxes(n, cycleLen, plotTitle, colors, log=False):
+def plotSummary(ledgers, trange, cfg, log=False):
+    """
+    Plot the last debt ratio of every pair of peers in trange as a user x peer
+    heatmap. The cost of rendering the heatmap only depends on the number of
+    peers, not on the number of ledger updates.
+    """
+
+    final = (
+        inTRange(ledgers, trange)["value"]
+        .groupby(level=[0, 1])
+        .last()
+        .unstack()
+        .reindex(index=ledgers.index.levels[0], columns=ledgers.index.levels[1])
+    )
+    for peer in final.index.intersection(final.columns):
+        final.loc[peer, peer] = np.nan
+
+    try:
+        fig, ax = mkHeatmap(
+            final.values, cfg["title"], "Peer", "User", "Debt Ratio", log=log
+        )
+    except Exception as e:
+        raise prependErr("plotting summary heatmap", e)
+    # rows and columns are numbered peers
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    return fig
+
+
+def plotHeatmap(ledgers, trange, cfg, log=False):
+    """
+    Plot the debt ratio history of every pair of peers as a heatmap with one
+    row per (ordered) pair and cfg["bins"] equal-width time buckets from
+    trange[0] to trange[1] as columns. Each cell holds the pair's last debt
+    ratio as of the end of the bucket (which may be from before trange[0]), so
+    the cost of rendering only depends on the size of the image, not on the
+    number of ledger updates.
+    """
+
+    tmin, tmax = trange
+    bins = cfg["bins"]
+    users = ledgers.index.get_level_values(0)
+    peers = ledgers.index.get_level_values(1)
+    time = ledgers.index.get_level_values(2)
+    # every pair that has a debt ratio by tmax gets a row
+    upToMax = ledgers[(users != peers) & (time <= tmax)]
+    pairs = upToMax.index.droplevel(2).unique().sort_values()
+    time = upToMax.index.get_level_values(2)
+    inRange = upToMax[tmin <= time]
+    seed = upToMax[time <= tmin]["value"].groupby(level=[0, 1]).last()
+
+    # bin every ledger update by pair and time bucket
+    time = inRange.index.get_level_values(2).values
+    width = (tmax - tmin) / bins if tmax > tmin else 1
+    binned = pd.DataFrame(
+        {
+            "pair": pairs.get_indexer(inRange.index.droplevel(2)),
+            "bucket": np.minimum(((time - tmin) // width).astype(int), bins - 1),
+            "value": inRange["value"].values,
+        }
+    )
+    matrix = (
+        binned.groupby(["pair", "bucket"])["value"]
+        .last()
+        .unstack()
+        .reindex(index=range(len(pairs)), columns=range(bins))
+    )
+    # start each row from the pair's last debt ratio at or before tmin
+    matrix[0] = matrix[0].fillna(
+        pd.Series(seed.values, index=pairs.get_indexer(seed.index))
+    )
+    matrix = matrix.ffill(axis=1)
+    # an image can't have zero width, so give an instant a 1s wide one
+    xmin, xmax = (tmin, tmax) if tmax > tmin else (tmin - 0.5, tmax + 0.5)
+
+    userNums = {user: i for i, user in enumerate(ledgers.index.levels[0])}
+    peerNums = {peer: j for j, peer in enumerate(ledgers.index.levels[1])}
+    try:
+        fig, ax = mkHeatmap(
+            matrix.values,
+            cfg["title"],
+            "time (seconds)",
+            "Pair",
+            "Debt Ratio",
+            log=log,
+            extent=(xmin, xmax, len(pairs) - 0.5, -0.5),
+        )
+    except Exception as e:
+        raise prependErr("plotting debt ratio heatmap", e)
+    if len(pairs) <= MAX_LEGEND_ENTRIES:
+        ax.set_yticks(range(len(pairs)))
+        ax.set_yticklabels(
+            [f"{peerNums[peer]} wrt {userNums[user]}" for user, peer in pairs]
+        )
+    else:
+        ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    return fig
+
+
+def mkHeatmap(matrix, plotTitle, xlabel, ylabel, cbarLabel, log=False, **kwargs):
+    """
+    Plot a 2d array as an image, leaving missing (NaN) values blank.
+
+    Inputs:
+        -   matrix (np.ndarray): Values to plot.
+        -   plotTitle (str): Title of this plot.
+        -   xlabel, ylabel, cbarLabel (str): Labels for the x axis, y axis and
+            color bar.
+        -   log (bool): Whether the color scale will be logarithmic.
+        -   kwargs: Keyword args for matplotlib's imshow().
+
+    Returns:
+        (matplotlib.figure.Figure, matplotlib.axes): The figure and its axis.
+    """
+
+    fig, ax = plt.subplots(tight_layout=False)
+    cmap = copy(plt.get_cmap("viridis"))
+    cmap.set_bad(ax.get_facecolor())
+    norm = mcolors.SymLogNorm(linthresh=1) if log else mcolors.Normalize()
+    img = ax.imshow(
+        np.ma.masked_invalid(matrix),
+        aspect="auto",
+        interpolation="nearest",
+        cmap=cmap,
+        norm=norm,
+        **kwargs,
+    )
+    ax.grid(False)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.colorbar(img, ax=ax, label=f"log({cbarLabel})" if log else cbarLabel)
+    fig.suptitle(
+        f"{plotTitle} (Semi-Log)" if log else plotTitle,
+        fontsize="large",
+        bbox={
+            "boxstyle": "round",
+            "facecolor": ax.get_facecolor(),
+            "edgecolor": "#000000",
+            "linewidth": 1,
+        },
+    )
+
+    return fig, ax
+
+
+def mkAxes(n, grid, plotTitle, subTitles, log=False, pages=None):
     """
-    Create and configure `n` axes for a given debt ratio plot.
+    Create and configure `n` axes for a given debt ratio plot. The axes are
+    laid out in pages (figures) with at most `grid` rows and columns each, so
+    the size of each figure doesn't grow with `n`.
 
     Inputs:
         -   n (int): Number of sub-plots to create.
+        -   grid ((int, int)): Maximum number of rows and columns of sub-plots
+            per page.
         -   plotTitle (str): Title of this plot.
+        -   subTitles ([str]): Title of each sub-plot. Only used if n > 1.
         -   log (bool): Whether the y-axis will be logarithmic.
+        -   pages ([int]): Indices of the pages to create (default: all of
+            them).
 
     Returns:
-        [matplotlib.axes]: List containing the `n` axes.
+        ([matplotlib.figure.Figure], dict{int: matplotlib.axes}): List
+        containing the pages, and dictionary that maps the index of each
+        sub-plot on those pages to its axis.
     """
 
-    fig, axes = plt.subplots(n, sharex=True, sharey=True, tight_layout=False)
-    fig.subplots_adjust(hspace=0.5)
-    if n == 1:
-        axes = [axes]
-
-    for i, ax in enumerate(axes):
-        ax.set_prop_cycle("color", colors[2 * i : 2 * i + cycleLen])
-
-        # if there are multiple plots in this figure, give each one a
-        # unique subtitle
-        if n > 1:
-            ax.set_title(
-                f"User {i}",
-                fontsize="medium",
-                bbox={
-                    "boxstyle": "round",
-                    "facecolor": ax.get_facecolor(),
-                    "edgecolor": "#000000",
-                    "linewidth": 1,
-                },
-            )
-
-        ylabel = "Debt Ratio"
-        titleArgs = {
-            "fontsize": "large",
-            "x": (ax.get_position().xmin + ax.get_position().xmax) / 2,
-            "y": 1.02,
-            "ha": "center",
-            "bbox": {
+    rows, cols, perPage, total = pageLayout(n, grid)
+
+    figs, axes = [], {}
+    for page in range(total) if pages is None else pages:
+        fig, pageAxes = plt.subplots(
+            rows,
+            cols,
+            sharex=True,
+            sharey=True,
+            squeeze=False,
+            tight_layout=False,
+            figsize=None if n == 1 else (4 * cols, 3 * rows),
+        )
+        fig.subplots_adjust(hspace=0.5)
+        pageAxes = pageAxes.flatten()
+        # remove the unused axes on the last page
+        k = min(perPage, n - page * perPage)
+        for ax in pageAxes[k:]:
+            fig.delaxes(ax)
+        pageAxes = pageAxes[:k]
+
+        for i, ax in enumerate(pageAxes):
+            # if there are multiple plots in this figure, give each one a
+            # unique subtitle
+            if n > 1:
+                ax.set_title(
+                    subTitles[page * perPage + i],
+                    fontsize="medium",
+                    bbox={
+                        "boxstyle": "round",
+                        "facecolor": ax.get_facecolor(),
+                        "edgecolor": "#000000",
+                        "linewidth": 1,
+                    },
+                )
+
+            ylabel = "Debt Ratio"
+            if i % cols == 0:
+                ax.set_ylabel(f"log({ylabel})" if log else ylabel)
+            # label the x axis of the bottom sub-plot in each column
+            if i + cols >= k:
+                ax.set_xlabel("time (seconds)")
+                ax.xaxis.set_tick_params(labelbottom=True)
+            axes[page * perPage + i] = ax
+
+        title = f"{plotTitle} (Semi-Log)" if log else plotTitle
+        if total > 1:
+            title += f" ({page + 1}/{total})"
+        fig.suptitle(
+            title,
+            fontsize="large",
+            y=1.02,
+            ha="center",
+            bbox={
                 "boxstyle": "round",
-                "facecolor": ax.get_facecolor(),
+                "facecolor": pageAxes[0].get_facecolor(),
                 "edgecolor": "#000000",
                 "linewidth": 1,
             },
-        }
-        if log:
-            ax.set_ylabel(f"log({ylabel})")
-            fig.suptitle(f"{plotTitle} (Semi-Log)", **titleArgs)
-        else:
-            ax.set_ylabel(ylabel)
-            fig.suptitle(plotTitle, **titleArgs)
+        )
+        figs.append(fig)
 
-    return fig, axes
+    return figs, axes
 
 
-def cfgAxes(axes, log=False, **kwargs):
+def pageLayout(n, grid):
     """
-    Configure axes settings that must be set after plotting (e.g. because
-    the pandas plotting function overwrites them).
+    Get how mkAxes() lays out `n` sub-plots with at most `grid` rows and
+    columns per page.
+
+    Returns:
+        (int, int, int, int): The rows and columns of each page, the number of
+        sub-plots per page, and the number of pages.
     """
-    # axes share y axis scale/range settings, so just set on first
+    if n == 1:
+        rows, cols = 1, 1
+    else:
+        rows, cols = grid
+        cols = min(cols, n)
+        rows = min(rows, ceil(n / cols))
+    return rows, cols, rows * cols, ceil(n / (rows * cols))
+
+
+def axisLimits(ledgers, log=False):
+    """
+    Get the axis limits that autoscaling the history in `ledgers` on a single
+    axis would give: the range of the data plus the axes.xmargin and
+    axes.ymargin margins. The y axis of the semi-log plot starts at 0.
+
+    Returns:
+        ((float, float), (float, float)): The x and y limits, or (None, None)
+        if `ledgers` is empty.
+    """
+    if len(ledgers) == 0:
+        return None, None
+    time = ledgers.index.get_level_values(2)
+    xlim = withMargin(time.min(), time.max(), rcParams["axes.xmargin"])
+    value = ledgers["value"]
     if log:
-        axes[0].set_yscale("symlog")
-        axes[0].set_ylim(bottom=0)
-    axes[0].autoscale(tight=False)
-    axes[-1].set_xlabel("time (seconds)")
-    for i, ax in enumerate(axes):
-        ax.legend(prop={"size": "medium"})
+        # the margins of symlog axes are added in log space. these are the
+        # defaults of the 'symlog' scale set by cfgAxes()
+        transform = mscale.SymmetricalLogTransform(base=10, linthresh=2, linscale=1)
+        lims = transform.transform_non_affine(np.array([value.min(), value.max()]))
+        ymax = withMargin(*lims, rcParams["axes.ymargin"])[1]
+        ylim = (0, transform.inverted().transform_non_affine(np.array([ymax]))[0])
+    else:
+        ylim = withMargin(value.min(), value.max(), rcParams["axes.ymargin"])
+    return xlim, ylim
+
+
+def withMargin(vmin, vmax, margin):
+    """
+    Pad [vmin, vmax] by `margin` times its width on both sides, widening it
+    first if it is empty.
+    """
+    vmin, vmax = mtransforms.nonsingular(float(vmin), float(vmax), expander=0.05)
+    pad = (vmax - vmin) * margin
+    return vmin - pad, vmax + pad
+
+
+def cfgAxes(axes, xlim, ylim, log=False):
+    """
+    Configure axes settings that must be set after plotting. Axes are only
+    shared within a page, so the limits of every page are set to `xlim` and
+    `ylim` (see axisLimits()), unless they are None.
+    """
+    for ax in axes:
+        if log:
+            ax.set_yscale("symlog")
+        if xlim is not None:
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*ylim)
+        _, labels = ax.get_legend_handles_labels()
+        if 0 < len(labels) <= MAX_LEGEND_ENTRIES:
+            ax.legend(prop={"size": "medium"})
+
+
+def savePages(figs, outfile, close=False, **kwargs):
+    """
+    Save the pages of a plot to `outfile` (a path or a binary file object).
+    PDFs get one page per figure. For other formats, only single page plots
+    can be saved. `figs` can be any iterable, e.g. iterPages(), and if `close`
+    is True, each page is closed as soon as it is saved.
+    """
+    fmt = kwargs.pop("format", None) or os.path.splitext(str(outfile))[1][1:]
+    if fmt == "pdf":
+        with PdfPages(outfile) as pdf:
+            for fig in figs:
+                pdf.savefig(fig, bbox_inches="tight", **kwargs)
+                if close:
+                    plt.close(fig)
+        return
+    saved = 0
+    for fig in figs:
+        if saved > 0:
+            if close:
+                plt.close(fig)
+            raise ValueError(f"can't save more than one page as {fmt}")
+        fig.savefig(outfile, format=fmt, bbox_inches="tight", **kwargs)
+        saved += 1
+        if close:
+            plt.close(fig)
+    if saved == 0:
+        raise ValueError(f"no pages to save as {fmt}")
+
+
+def mkColorPairs(n):
+    """
+    Get `n` (inner, outer) color pairs. The hard-coded COLOR_PAIRS are used
+    when there are few enough pairs, otherwise the pairs are sampled from a
+    colormap so that each pair's colors are as far apart as possible.
+    """
+    if n <= len(COLOR_PAIRS):
+        return COLOR_PAIRS[:n]
+    cmap = plt.get_cmap("hsv")
+    sampled = [
+        mcolors.to_hex(cmap(x)) for x in np.linspace(0, 1, 2 * n, endpoint=False)
+    ]
+    return list(zip(sampled[:n], sampled[n:]))
+
+
+def numPages(cfg):
+    """
+    Get the number of pages that plot() will make for config `cfg`.
+    """
+    return pageLayout(cfg["num_axes"], cfg["grid"])[3]
+
+
+def inTRange(ledgers, trange):
+    """
+    Get the rows of `ledgers` from trange[0] to trange[1] (inclusive).
+    """
+    tmin, tmax = trange
+    time = ledgers.index.get_level_values(2)
+    return ledgers[(tmin <= time) & (time <= tmax)]
 
 
 def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
@@ -239,7 +578,8 @@ def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
     Inputs:
         -   ledgers (pd.DataFrame)
         -   trange ((pd.Datetime, pd.Datetime)): Time range to plot
-        -   params (dict): Node parameters as loaded in load().
+        -   params (dict): Node parameters as loaded in load(). Missing
+            parameters are left out of the title.
         -   kind (str): Which type of plot to configure for. Possible
             values:
             -   'all': Plot every peerwise time series of debt ratio values on
@@ -247,7 +587,12 @@ def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
                 of peers.
             -   'pairs': Make one time-series plot for each pair of peers i, j.
                 Each plot will contain two lines: one for user i's view of peer
-                j, and one for j's view of i.
+                j, and one for j's view of i. The plots are laid out in pages
+                of `grid` plots.
+            -   'summary': Make a single user x peer heatmap of each pair's
+                last debt ratio in trange.
+            -   'heatmap': Make a single heatmap of every pair's debt ratio
+                over time, binned into `bins` time buckets.
         -   kwargs: Keyword args that should be inserted into the returned cfg
             dict. These will overwrite keys of the same name.
         Note: Two users are considered 'peers' if at least one of them has a
@@ -255,18 +600,29 @@ def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
 
     Returns:
         cfg (dict): Dictionary containing the following keys/values:
+            -   kind (str): The kind of plot.
             -   title (str): The plot title.
             -   fbasename (str): Basename of the file to save the plot to (if any).
                 This value should be None if the plot should not be saved.
+            -   fdir (str): Directory to save the plot in.
             -   fext (str): Extension to use when saving the plot. Only used if
                 fbasename field is not None.
             -   num_axes (int): The number of sub-plots to make.
+            -   grid ((int, int)): Maximum rows and columns of sub-plots per
+                page.
+            -   bins (int): The number of time buckets for heatmaps.
+            -   drstats (dict): Precomputed debt ratio statistics of the
+                full history (e.g. from loadChunked()), or None to compute
+                them from `ledgers`.
             -   pairs (int): The number of pairs of peers there are to plot. One for
                 every pair of peers that have a history together.
-            -   cycleLen (int): The length of the color cycle for matplotlib.
-            -   colors ([str]): List of the colors to use in the color cycle.
+            -   axisMap (dict{(str, str): int}): Dictionary that maps an ordered
+                pair of peers to the index of the sub-plot to plot them on.
+            -   axisTitles ([str]): The title of each sub-plot.
             -   colorMap (dict{(str, str): (str, str)}): Dictionary that maps an
                 ordered pair of peers to their corresponding pair of plot colors.
+            -   missing ([(str, str)]): Ordered pairs of peers that have a
+                history, but not in trange.
             -   All key/value pairs from kwargs.
     """
 
@@ -276,12 +632,20 @@ def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
     paramTitles["round_burst"] = "RB"
     pts = []
     for p, t in paramTitles.items():
-        vals = params[p]
+        # results stores built from raw logs may not have every parameter
+        if p not in params or params[p].isna().all():
+            continue
+        vals = params[p].fillna("?")
         if vals.nunique() == 1:
             pts.append(f"{t}: {vals[0].title()}")
         else:
             pts.append(f"{t}s: [{', '.join(vals).title()}]")
-    title = f"Debt Ratio vs. Time -- {', '.join(pts)}"
+    if kind == "summary":
+        title = "Final Debt Ratio"
+    else:
+        title = "Debt Ratio vs. Time"
+    if len(pts) > 0:
+        title += f" -- {', '.join(pts)}"
     fbasename = (
         f"{'-'.join(pts)}".replace(", ", "_")
         .replace(": ", "-")
@@ -289,50 +653,63 @@ def mkPlotConfig(ledgers, trange, params, kind, **kwargs):
         .lower()
     )
 
-    tmin, tmax = trange
-    colorPairs = [("magenta", "black"), ("green", "orange"), ("blue", "red")]
+    # figure out which peers have a history in this data range, and assign
+    # colors and axes to each pair
+    userNums = {user: i for i, user in enumerate(ledgers.index.levels[0])}
+    peerNums = {peer: j for j, peer in enumerate(ledgers.index.levels[1])}
+    allPairs = ledgers.index.droplevel(2).unique()
+    inRange = set(inTRange(ledgers, trange).index.droplevel(2).unique())
+    ordered = []
+    missing = []
+    for user, peer in allPairs.sort_values():
+        if user == peer:
+            continue
+        if (user, peer) in inRange:
+            ordered.append((user, peer))
+        else:
+            missing.append((user, peer))
+    unordered = []
+    seen = set()
+    for user, peer in ordered:
+        if (peer, user) not in seen:
+            unordered.append((user, peer))
+            seen.add((user, peer))
+    pairs = len(unordered)
+
     colorMap = {}
-    colors = []
-    # figure out how many peers have a history in this data range, and assign
-    # colors to each pair
-    pairs = 0
-    for user in ledgers.index.levels[0]:
-        u = ledgers.loc[user]
-        for peer in u.index.levels[0]:
-            if user == peer:
-                continue
-            p = u.loc[peer]
-            if len(p[(tmin <= p.index) & (p.index <= tmax)]) > 0:
-                if (user, peer) not in colorMap:
-                    colors.append(colorPairs[pairs][0])
-                    colorMap[user, peer] = colorPairs[pairs]
-                    colorMap[peer, user] = colorPairs[pairs][::-1]
-                    pairs += 1
-                else:
-                    colors.append(colorMap[peer, user][1])
-
-    if kind == "all":
+    axisMap = {}
+    axisTitles = []
+    for k, ((user, peer), colors) in enumerate(zip(unordered, mkColorPairs(pairs))):
+        colorMap[user, peer] = colors
+        colorMap[peer, user] = colors[::-1]
+        if kind == "pairs":
+            axisMap[user, peer] = axisMap[peer, user] = k
+            axisTitles.append(f"Users {userNums[user]} and {peerNums[peer]}")
+        else:
+            axisMap[user, peer] = axisMap[peer, user] = 0
+
+    if kind == "pairs":
+        # one plot axis for every pair of peers (order doesn't matter)
+        n = max(pairs, 1)
+    else:
         # only make a single plot axis
         n = 1
-        # the color cycle length is equal to the number of pairs of peers
-        # (order matters)
-        cycleLen = pairs * 2
-    elif kind == "pairs":
-        # one plot axis for every user
-        n = pairs
-        # the color cycle length is equal to the number of pairs of peers
-        # (order doesn't matter)
-        cycleLen = pairs
 
     return {
+        "kind": kind,
         "title": title,
         "fbasename": fbasename,
+        "fdir": "",
         "fext": ".pdf",
         "num_axes": n,
+        "grid": (3, 2),
+        "bins": 500,
+        "drstats": None,
         "pairs": pairs,
-        "cycleLen": cycleLen,
-        "colors": colors,
+        "axisMap": axisMap,
+        "axisTitles": axisTitles,
         "colorMap": colorMap,
+        "missing": missing,
         **kwargs,
     }
 
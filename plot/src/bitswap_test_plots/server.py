@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import hashlib
+import io
+import json
+import os
+import os.path
+import traceback
+
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import matplotlib
+
+# the server never opens a window, so render off-screen (must happen before
+# pyplot is imported by the local modules)
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+# local imports
+from app import load, secondsIndex, getTRange  # noqa: E402
+from store import loadStore, STATE  # noqa: E402
+from plot import (  # noqa: E402
+    iterPages,
+    mkPlotConfig,
+    savePages,
+    numPages,
+    prependErr,
+    warn,
+    KINDS,
+)
+
+FORMATS = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "json": "application/json",
+}
+SCALES = ["linear", "log"]
+
+
+def run():
+    args = cli()
+    server = PlotServer(
+        args.root,
+        args.results_mb * 2**20,
+        args.figures_mb * 2**20,
+        (args.host, args.port),
+    )
+    print(f"serving plots for {server.root} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def cli():
+    """
+    Parse CLI args.
+    """
+    parser = argparse.ArgumentParser()
+    # fmt: off
+    parser.add_argument(
+        "-H",
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="address to listen on",
+    )
+    parser.add_argument(
+        "-P",
+        "--port",
+        type=int,
+        default=8000,
+        help="port to listen on",
+    )
+    parser.add_argument(
+        "--results-mb",
+        type=float,
+        default=1024,
+        help="memory budget (in MiB) for cached results",
+    )
+    parser.add_argument(
+        "--figures-mb",
+        type=float,
+        default=128,
+        help="memory budget (in MiB) for cached rendered figures",
+    )
+    parser.add_argument(
+        "root",
+        metavar="<results_dir>",
+        type=str,
+        help="directory containing the json results files to serve",
+    )
+    # fmt: on
+    return parser.parse_args()
+
+
+class LRUCache:
+    """
+    Least-recently-used cache whose capacity is a budget on the total size of
+    the cached values (as measured by `sizeof`) rather than on the number of
+    entries.
+    """
+
+    def __init__(self, budget, sizeof):
+        self.budget = budget
+        self.sizeof = sizeof
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Return the value cached for `key` (marking it as most recently used),
+        or None if there is none.
+        """
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value):
+        """
+        Cache `value` under `key`, evicting the least recently used entries
+        until the cache fits in its budget. Values that are larger than the
+        whole budget are not cached. Returns `value`.
+        """
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        size = self.sizeof(value)
+        if size > self.budget:
+            warn(f"not caching {key}: {size} bytes exceeds budget {self.budget}")
+            return value
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.budget:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+        return value
+
+
+class PlotServer(HTTPServer):
+    """
+    HTTP server that renders plots for the results files under `root`. Parsed
+    results and rendered figures are kept in memory, so repeated requests for
+    the same file (e.g. while scrubbing through time ranges) do not reload or
+    re-render anything.
+
+    pyplot is not thread-safe, so requests are handled one at a time.
+    """
+
+    def __init__(self, root, resultsBudget, figuresBudget, address):
+        super().__init__(address, PlotHandler)
+        self.root = os.path.realpath(root)
+        # file hashes, keyed by (path, mtime, size)
+        self.hashes = {}
+        # results as returned by load(), keyed by file hash (or by path, for
+        # results stores)
+        self.results = LRUCache(resultsBudget, resultsSize)
+        # rendered figures, keyed by (file hash, kind, trange, scale, format,
+        # page)
+        self.figures = LRUCache(figuresBudget, len)
+
+    def resolve(self, fname):
+        """
+        Get the absolute path of results file (or results store directory)
+        `fname`, which must be inside the server's root directory.
+        """
+        path = os.path.realpath(os.path.join(self.root, fname))
+        if not path.startswith(self.root + os.sep):
+            raise PermissionError(f"{fname} is outside of {self.root}")
+        if not (os.path.isfile(path) or os.path.isfile(os.path.join(path, STATE))):
+            raise FileNotFoundError(f"no such results file: {fname}")
+        return path
+
+    def fileHash(self, path):
+        """
+        Get the hash of the contents of the file at `path`. Hashes are only
+        recomputed when the file's modification time or size changes. Results
+        stores are identified by their state file, which is rewritten by every
+        append.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, STATE)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if key not in self.hashes:
+            h = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(2**20), b""):
+                    h.update(block)
+            self.hashes[key] = h.hexdigest()
+        return self.hashes[key]
+
+    def getResults(self, fhash, path):
+        """
+        Get the results for file `path` with hash `fhash`, loading them if
+        they're not cached.
+        """
+        if os.path.isdir(path):
+            # stores are cached by path, and when they change only the data
+            # appended since they were last loaded is read
+            results = self.results.get(path)
+            if results is None or results["hash"] != fhash:
+                results = loadStore(path, results)
+                results["hash"] = fhash
+                self.results.put(path, results)
+            return results
+
+        results = self.results.get(fhash)
+        if results is None:
+            results = load(path)
+            results["ledgers"] = secondsIndex(results["ledgers"])
+            self.results.put(fhash, results)
+        return results
+
+    def render(self, fname, kind, scale, fmt, page=0, prange=None, trange=None):
+        """
+        Render a plot of results file `fname`.
+
+        Inputs:
+            -   fname (str): Path of the results file, relative to the server
+                root.
+            -   kind (str): Which kind of plot to make. See mkPlotConfig().
+            -   scale (str): 'linear' or 'log'.
+            -   fmt (str): One of the keys of FORMATS.
+            -   page (int): Which page of the plot to render. PDFs always
+                contain every page.
+            -   prange, trange: Time range to plot. See getTRange().
+
+        Returns:
+            bytes: The rendered plot.
+        """
+
+        path = self.resolve(fname)
+        fhash = self.fileHash(path)
+        results = self.getResults(fhash, path)
+        ledgers = results["ledgers"]
+        try:
+            tmin, tmax = getTRange(ledgers, prange=prange, trange=trange)
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+        # key on the resolved time range so that different requested ranges
+        # that select the same data share a figure
+        if fmt != "png":
+            page = None
+        key = (fhash, kind, (float(tmin), float(tmax)), scale, fmt, page)
+        out = self.figures.get(key)
+        if out is not None:
+            return out
+
+        if fmt == "json":
+            out = renderJSON(ledgers, (tmin, tmax))
+        else:
+            cfg = mkPlotConfig(
+                ledgers,
+                (tmin, tmax),
+                results["params"],
+                kind,
+                fbasename=None,
+                drstats=results.get("drstats"),
+            )
+            if page is not None and page >= numPages(cfg):
+                raise BadRequest(f"plot only has {numPages(cfg)} page(s)")
+            # only make the requested scale and page, closing each page as
+            # soon as it is saved
+            buf = io.BytesIO()
+            try:
+                savePages(
+                    iterPages(
+                        ledgers,
+                        (tmin, tmax),
+                        cfg,
+                        log=scale == "log",
+                        pages=None if page is None else [page],
+                    ),
+                    buf,
+                    format=fmt,
+                    close=True,
+                )
+            except Exception:
+                # don't leave the page being drawn open
+                plt.close("all")
+                raise
+            out = buf.getvalue()
+        return self.figures.put(key, out)
+
+
+class PlotHandler(BaseHTTPRequestHandler):
+    """
+    Handles requests of the form:
+
+        GET /plot?file=<results_file>&kind=<kind>&scale=<scale>&format=<format>
+            [&page=<page>] [&prange=<lower>,<upper> | &trange=<lower>,<upper>]
+
+    where `file` is relative to the server root and the remaining parameters
+    are optional (defaulting to kind=all, scale=linear, format=png and
+    page=0).
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/plot":
+            self.sendError(404, f"unknown path {url.path}")
+            return
+        try:
+            args = parseQuery(parse_qs(url.query))
+            out = self.server.render(**args)
+        except BadRequest as e:
+            self.sendError(400, str(e))
+            return
+        except PermissionError as e:
+            self.sendError(403, str(e))
+            return
+        except FileNotFoundError as e:
+            self.sendError(404, str(e))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.sendError(500, str(prependErr("rendering plot", e)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[args["fmt"]])
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def sendError(self, code, msg):
+        body = json.dumps({"error": msg}).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", FORMATS["json"])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BadRequest(ValueError):
+    """
+    Raised for invalid plot requests.
+    """
+
+
+def parseQuery(query):
+    """
+    Convert the query parameters of a plot request into keyword arguments for
+    PlotServer.render(). Raises BadRequest for invalid parameters.
+    """
+
+    def single(name, default=None):
+        vals = query.get(name)
+        if vals is None:
+            return default
+        if len(vals) != 1:
+            raise BadRequest(f"parameter {name} specified more than once")
+        return vals[0]
+
+    def bounds(name):
+        val = single(name)
+        if val is None:
+            return None
+        try:
+            lower, upper = (float(v) for v in val.split(","))
+        except ValueError:
+            raise BadRequest(f"{name} should be of the form <lower>,<upper>")
+        return lower, upper
+
+    args = {
+        "fname": single("file"),
+        "kind": single("kind", "all"),
+        "scale": single("scale", "linear"),
+        "fmt": single("format", "png"),
+        "page": single("page", "0"),
+        "prange": bounds("prange"),
+        "trange": bounds("trange"),
+    }
+    if args["fname"] is None:
+        raise BadRequest("missing parameter file")
+    if args["kind"] not in KINDS:
+        raise BadRequest(f"kind should be one of {KINDS}")
+    if args["scale"] not in SCALES:
+        raise BadRequest(f"scale should be one of {SCALES}")
+    if args["fmt"] not in FORMATS:
+        raise BadRequest(f"format should be one of {list(FORMATS)}")
+    if not args["page"].isdigit():
+        raise BadRequest("page should be a non-negative integer")
+    args["page"] = int(args["page"])
+    if args["prange"] is not None and args["trange"] is not None:
+        raise BadRequest("at most one of prange and trange may be specified")
+    return args
+
+
+def renderJSON(ledgers, trange):
+    """
+    Serialize the debt ratio history of every pair of peers in `trange` as
+    json.
+    """
+
+    tmin, tmax = trange
+    time = ledgers.index.get_level_values(2)
+    inRange = ledgers[(tmin <= time) & (time <= tmax)]
+    series = [
+        {
+            "user": user,
+            "peer": peer,
+            "time": p.index.get_level_values(2).tolist(),
+            "value": p["value"].tolist(),
+            "sent": p["sent"].tolist(),
+            "recv": p["recv"].tolist(),
+        }
+        for (user, peer), p in inRange.groupby(level=[0, 1])
+        if user != peer
+    ]
+    return json.dumps({"trange": [tmin, tmax], "series": series}).encode()
+
+
+def resultsSize(results):
+    """
+    Approximate the memory used by the dataframes in `results`, in bytes.
+    """
+    return int(
+        sum(
+            df.memory_usage(index=True, deep=True).sum()
+            for df in results.values()
+            if hasattr(df, "memory_usage")
+        )
+    )
+
+
+if __name__ == "__main__":
+    try:
+        run()
+    except Exception as e:
+        print(prependErr("running plot server", e), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import hashlib
+import json
+import os
+import os.path
+import traceback
+import uuid
+
+import pandas as pd
+
+# local imports
+from chunked import (
+    iterNodes,
+    iterChunks,
+    aggregate,
+    combineStats,
+    metaFrames,
+    relativeSeries,
+    drStats,
+    HISTORY_FIELDS,
+    LAST_FIELDS,
+)
+from plot import prependErr
+
+# A results store is a directory that results can be appended to as a run
+# progresses, containing:
+#   -   state.json: The store's time resolution, how far each node's raw log
+#       has been read, how many lines of each node's series file are
+#       superseded, and the summary statistics of every pair of peers (see
+#       chunked.aggregate()). The time of each pair's last update is its
+#       high-water mark: appended ledger updates that aren't newer than it
+#       have already been stored, and are skipped.
+#   -   nodes.json: Every node's metadata (everything in the results file
+#       except the history).
+#   -   ledgers_<id>.jsonl: The raw archive of every ledger update of node
+#       <id>, one per line (with times in nanoseconds since the epoch). It
+#       isn't read when loading the store, but keeps the full resolution
+#       history, e.g. to rebuild the store at a finer resolution.
+#   -   series_<id>.jsonl: The downsampled history of node <id>. The first
+#       line identifies the file (see SERIES_HEADER), and every other line is
+#       a bucket. Buckets that are updated by later appends are appended
+#       again, and the last line for a bucket wins. Once more than half of
+#       the lines are superseded, the file is replaced by a compacted copy
+#       (with a new identifier).
+# Appending only reads the (per pair) state and writes the new updates, so its
+# cost doesn't depend on how much has been stored already. Similarly,
+# reloading a store (see loadStore()) only reads the series lines appended
+# since it was last loaded.
+STATE = "state.json"
+NODES = "nodes.json"
+SERIES_HEADER = "file"
+
+
+def run():
+    args = cli()
+    try:
+        state = openStore(args.store, args.resolution)
+        if args.cmd == "import":
+            for fname in args.infiles:
+                n = importResults(args.store, state, fname, args.chunksize)
+                print(f"appended {n} ledger updates from {fname}")
+        elif args.cmd == "append":
+            meta = dict(kv.split("=", 1) for kv in args.meta)
+            updateNodes(args.store, {args.id: {"id": args.id, **meta}})
+            for fname in args.logfiles:
+                n = appendLog(args.store, state, args.id, fname, args.chunksize)
+                print(f"appended {n} ledger updates from {fname}")
+    except Exception as e:
+        print(prependErr("updating results store", e), file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(1)
+
+
+def cli():
+    """
+    Parse CLI args.
+    """
+    parser = argparse.ArgumentParser()
+    # fmt: off
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        type=float,
+        default=1.0,
+        help="time resolution (in seconds) of the downsampled history. only "
+        "used when creating a store",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=100000,
+        help="maximum number of ledger updates to process at once",
+    )
+    parser.add_argument(
+        "store",
+        metavar="<store_dir>",
+        type=str,
+        help="results store directory (created if it doesn't exist)",
+    )
+    cmds = parser.add_subparsers(dest="cmd")
+    cmds.required = True
+    importCmd = cmds.add_parser(
+        "import",
+        help="append the ledger updates from json results files",
+    )
+    importCmd.add_argument(
+        "infiles",
+        metavar="<results_file>",
+        type=str,
+        nargs="+",
+        help="json results file, as written by test.sh",
+    )
+    appendCmd = cmds.add_parser(
+        "append",
+        help="append the ledger updates from a node's raw DebtRatio log",
+    )
+    appendCmd.add_argument(
+        "-m",
+        "--meta",
+        metavar="KEY=VALUE",
+        action="append",
+        default=[],
+        help="set node metadata (e.g. strategy=identity)",
+    )
+    appendCmd.add_argument(
+        "id",
+        metavar="<node_id>",
+        type=str,
+        help="id of the node the log belongs to",
+    )
+    appendCmd.add_argument(
+        "logfiles",
+        metavar="<log_file>",
+        type=str,
+        nargs="+",
+        help="ipfs log file with one DebtRatio json event per line",
+    )
+    # fmt: on
+    return parser.parse_args()
+
+
+def openStore(path, resolution=1.0):
+    """
+    Get the state of the results store at `path`, creating the store if it
+    doesn't exist.
+
+    Returns:
+        state (dict): Dictionary containing:
+            -   resolution (float): Time resolution of the downsampled history,
+                in seconds.
+            -   stats (pd.DataFrame): Summary statistics, as returned by
+                chunked.aggregate(), or None if nothing has been stored.
+            -   offsets (dict{str: dict{str: int}}): How far each of each
+                node's raw logs has been read by appendLog(), in bytes, keyed
+                by node id and then by the log's logHead().
+            -   dead (dict{str: [int, int]}): The number of superseded lines
+                and the total number of bucket lines in each node's series
+                file.
+    """
+
+    if not os.path.exists(os.path.join(path, STATE)):
+        os.makedirs(path, exist_ok=True)
+        state = {"resolution": resolution, "stats": None, "offsets": {}, "dead": {}}
+        saveState(path, state)
+        return state
+    return readState(path)
+
+
+def readState(path):
+    """
+    Get the state of the existing results store at `path` (see openStore()).
+    Raises FileNotFoundError if `path` isn't a results store.
+    """
+
+    fname = os.path.join(path, STATE)
+    if not os.path.exists(fname):
+        raise FileNotFoundError(f"{path} is not a results store (no {STATE})")
+    with open(fname, "r") as jfile:
+        jdata = json.load(jfile)
+    stats = None
+    if len(jdata["stats"]) > 0:
+        stats = pd.DataFrame.from_records(jdata["stats"], index=["id", "peer"])
+    return {
+        "resolution": jdata["resolution"],
+        "stats": stats,
+        "offsets": jdata["offsets"],
+        "dead": jdata.get("dead", {}),
+    }
+
+
+def saveState(path, state):
+    """
+    Atomically write the store's state.
+    """
+    stats = state["stats"]
+    jdata = {
+        "resolution": state["resolution"],
+        "stats": [] if stats is None else stats.reset_index().to_dict("records"),
+        "offsets": state["offsets"],
+        "dead": state["dead"],
+    }
+    tmp = os.path.join(path, f"{STATE}.tmp")
+    with open(tmp, "w") as jfile:
+        json.dump(jdata, jfile, default=int)
+    os.replace(tmp, os.path.join(path, STATE))
+
+
+def updateNodes(path, meta):
+    """
+    Merge node metadata `meta` (a dict mapping node ids to metadata) into the
+    store's.
+    """
+    fname = os.path.join(path, NODES)
+    nodes = {}
+    if os.path.exists(fname):
+        with open(fname, "r") as jfile:
+            nodes = json.load(jfile)
+    for nodeId, m in meta.items():
+        nodes.setdefault(nodeId, {}).update(m)
+    tmp = f"{fname}.tmp"
+    with open(tmp, "w") as jfile:
+        json.dump(nodes, jfile)
+    os.replace(tmp, fname)
+
+
+def appendHistory(path, state, nodeId, history, chunksize=100000):
+    """
+    Append ledger updates to the store, skipping those that aren't newer than
+    their pair's high-water mark (i.e. that are already stored).
+
+    Inputs:
+        -   path (str): Path of the store.
+        -   state (dict): The store's state, as returned by openStore(). It is
+            updated in place.
+        -   nodeId (str): The node whose ledger updates these are.
+        -   history ([dict]): Ledger updates, in the format of the history
+            entries of a results file.
+        -   chunksize (int): Maximum number of ledger updates to process at
+            once.
+
+    Returns:
+        int: The number of ledger updates appended.
+    """
+
+    appended = 0
+    for chunk in iterChunks(nodeId, history, chunksize):
+        chunk = newerThan(chunk, state["stats"])
+        if len(chunk) == 0:
+            continue
+        stats, series = aggregate(chunk, state["resolution"])
+
+        # write the data before the state, so that an interrupted append is
+        # retried (at worst re-appending some lines) rather than lost
+        writeLines(
+            os.path.join(path, f"ledgers_{nodeId}.jsonl"),
+            chunk.drop(columns="id").to_dict("records"),
+        )
+        appendSeries(path, nodeId, series)
+        dead, lines = state["dead"].get(nodeId, [0, 0])
+        dead += supersededBuckets(series, state["stats"], state["resolution"])
+        lines += len(series)
+        if dead > lines // 2:
+            lines = compactSeries(path, nodeId)
+            dead = 0
+        state["dead"][nodeId] = [dead, lines]
+        if state["stats"] is None:
+            state["stats"] = stats
+        else:
+            state["stats"] = combineStats([state["stats"], stats])
+        saveState(path, state)
+        appended += len(chunk)
+
+    return appended
+
+
+def importResults(path, state, fname, chunksize=100000):
+    """
+    Append the ledger updates (and metadata) of every node in a json results
+    file to the store.
+    """
+    appended = 0
+    for node in iterNodes(fname):
+        history = node.pop("history")
+        updateNodes(path, {node["id"]: node})
+        appended += appendHistory(path, state, node["id"], history, chunksize)
+    return appended
+
+
+def appendLog(path, state, nodeId, fname, chunksize=100000):
+    """
+    Append the ledger updates in a node's raw DebtRatio log (as captured by
+    test.sh) to the store. The log is read from where the last append of the
+    same log stopped, so appending a new copy of a growing log only reads the
+    new lines. A last line that was still being written when the log was
+    copied is left for the next append.
+    """
+
+    history = []
+    with open(fname, "rb") as logfile:
+        head = logHead(logfile)
+        offsets = state["offsets"].setdefault(nodeId, {})
+        offset = offsets.get(head, 0)
+        if head is None or os.fstat(logfile.fileno()).st_size < offset:
+            # another of the node's logs, or a restart of it, is read from the
+            # start (updates that are already stored are still skipped by
+            # their high-water marks)
+            offset = 0
+        logfile.seek(offset)
+        for line in logfile:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            history.append({k: event.get(k) for k in HISTORY_FIELDS})
+
+    appended = appendHistory(path, state, nodeId, history, chunksize)
+    if head is not None:
+        offsets[head] = offset
+    saveState(path, state)
+    return appended
+
+
+def logHead(logfile):
+    """
+    Identify a raw log by a hash of its first line, which copies of a growing
+    log share, but the node's other logs and restarts of its log (whose first
+    update has a new time) don't. Returns None if the first line is
+    incomplete.
+    """
+    line = logfile.readline()
+    if not line.endswith(b"\n"):
+        return None
+    return hashlib.sha1(line).hexdigest()
+
+
+def newerThan(chunk, stats):
+    """
+    Get the rows of `chunk` that are newer than their pair's high-water mark
+    in `stats`.
+    """
+    if stats is None:
+        return chunk
+    hwm = chunk.join(stats["time"].rename("hwm"), on=["id", "peer"])["hwm"]
+    return chunk[~(chunk["time"] <= hwm)]
+
+
+def writeLines(fname, records):
+    with open(fname, "a") as jfile:
+        for r in records:
+            jfile.write(json.dumps(r, default=int))
+            jfile.write("\n")
+
+
+def appendSeries(path, nodeId, series):
+    """
+    Append downsampled history buckets (see chunked.aggregate()) to a node's
+    series file, creating it if it doesn't exist.
+    """
+    fname = os.path.join(path, f"series_{nodeId}.jsonl")
+    if not os.path.exists(fname):
+        writeLines(fname, [{SERIES_HEADER: uuid.uuid4().hex}])
+    writeLines(fname, series.reset_index(level=[1, 2]).to_dict("records"))
+
+
+def supersededBuckets(series, stats, resolution):
+    """
+    Count the buckets in `series` that replace an already stored bucket. Only
+    the bucket of a pair's last stored update can still be updated, since
+    older updates are skipped.
+    """
+    if stats is None:
+        return 0
+    last = (stats["time"] // int(resolution * 1e9)).rename("last")
+    buckets = series.index.to_frame(index=False)
+    return int(
+        (buckets["bucket"] == buckets.join(last, on=["id", "peer"])["last"]).sum()
+    )
+
+
+def compactSeries(path, nodeId):
+    """
+    Atomically replace a node's series file with a copy (with a new
+    identifier) that only has the last line for each bucket.
+
+    Returns:
+        int: The number of buckets in the compacted file.
+    """
+
+    fname = os.path.join(path, f"series_{nodeId}.jsonl")
+    buckets = {}
+    with open(fname, "r") as jfile:
+        next(jfile)
+        for line in jfile:
+            r = json.loads(line)
+            buckets[r["peer"], r["bucket"]] = r
+    tmp = f"{fname}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    writeLines(tmp, [{SERIES_HEADER: uuid.uuid4().hex}, *buckets.values()])
+    os.replace(tmp, fname)
+    return len(buckets)
+
+
+def readSeries(fname, fileId, offset):
+    """
+    Read the buckets appended to a series file since it was read up to byte
+    `offset` of the file with identifier `fileId`. If the file has been
+    replaced since (i.e. its identifier changed), it is read from the start. A
+    last line that is still being written is left for the next read.
+
+    Returns:
+        (pd.DataFrame, str, int, bool): The buckets read, with the columns
+        peer, bucket and LAST_FIELDS, the file's identifier, the offset to
+        read from next time, and whether the file was read from the start.
+    """
+
+    records = []
+    currentId, reread = fileId, False
+    with open(fname, "rb") as jfile:
+        header = jfile.readline()
+        if header.endswith(b"\n"):
+            currentId = json.loads(header)[SERIES_HEADER]
+            reread = currentId != fileId
+            if reread:
+                offset = len(header)
+            jfile.seek(offset)
+            for line in jfile:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                records.append(json.loads(line))
+    buckets = pd.DataFrame.from_records(
+        records, columns=["peer", "bucket", *LAST_FIELDS]
+    )
+    return buckets, currentId, offset, reread
+
+
+def loadStore(path, cached=None):
+    """
+    Load a results store into the dataframes returned by chunked.loadChunked().
+
+    Inputs:
+        -   path (str): Path of the store.
+        -   cached (dict): The results of a previous call to loadStore() for
+            the same store, if any. Only the series lines appended since then
+            are read.
+
+    Returns:
+        The same dictionary as chunked.loadChunked(), plus:
+            -   series (pd.DataFrame): Every node's downsampled history,
+                indexed by (id, peer, bucket).
+            -   files (dict{str: (str, int)}): The identifier of each node's
+                series file and how far it has been read, in bytes.
+    """
+
+    state = readState(path)
+    if state["stats"] is None:
+        raise ValueError(f"no ledger history in {path}")
+    nodes = {}
+    if os.path.exists(os.path.join(path, NODES)):
+        with open(os.path.join(path, NODES), "r") as jfile:
+            nodes = json.load(jfile)
+    # nodes whose logs were appended without any metadata
+    for nodeId in state["stats"].index.unique(level=0):
+        nodes.setdefault(nodeId, {"id": nodeId})
+
+    series = None if cached is None else cached["series"]
+    files = {} if cached is None else dict(cached["files"])
+    new, reread = [], []
+    for nodeId in state["stats"].index.unique(level=0):
+        buckets, fileId, offset, fromStart = readSeries(
+            os.path.join(path, f"series_{nodeId}.jsonl"),
+            *files.get(nodeId, (None, 0)),
+        )
+        files[nodeId] = (fileId, offset)
+        if fromStart:
+            reread.append(nodeId)
+        buckets.insert(0, "id", nodeId)
+        new.append(buckets)
+    new = (
+        pd.concat(new)
+        .drop_duplicates(subset=["id", "peer", "bucket"], keep="last")
+        .set_index(["id", "peer", "bucket"])
+    )
+    if series is None:
+        series = new
+    else:
+        # replace the buckets that were updated, and every bucket of the
+        # nodes whose series file was compacted
+        updated = series.index.isin(new.index)
+        compacted = series.index.get_level_values(0).isin(reread)
+        series = pd.concat([series[~(updated | compacted)], new])
+
+    meta = [{"uploads": [], "dl_times": [], **m} for m in nodes.values()]
+    return {
+        **metaFrames(meta),
+        "ledgers": relativeSeries(series, state["stats"]["first"].min()),
+        "stats": state["stats"],
+        "drstats": drStats(state["stats"]),
+        "series": series,
+        "files": files,
+    }
+
+
+if __name__ == "__main__":
+    run()
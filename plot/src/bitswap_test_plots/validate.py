@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+# local imports
+from plot import warn
+
+
+def validate(ledgers, correctClocks=False):
+    """
+    Check the ledger updates of every node for signs of lost log lines, and
+    estimate each node's clock offset from the transfers between nodes.
+
+    Every transfer from node i to node j shows up twice: as an update of i's
+    ledger for j where `sent` reaches some value, and as an update of j's
+    ledger for i where `recv` reaches the same value. So:
+        -   A `sent` value logged by i that j never logs as a `recv` value
+            (or vice versa) means that one of them lost a log line.
+        -   The difference between the times i and j logged the same value
+            is the transfer's latency plus the difference between their
+            clocks. Assuming the latency is the same in both directions, the
+            clock difference is half the difference between the median
+            i -> j and j -> i time differences.
+
+    Inputs:
+        -   ledgers (pd.DataFrame): Ledger updates in the order they were
+            logged, with the columns id, peer, time (pd.Timestamp), sent and
+            recv (i.e. before the index is set in load()).
+        -   correctClocks (bool): Whether to subtract the estimated clock
+            offsets from the ledger update times.
+
+    Returns:
+        (pd.DataFrame, dict): The (possibly corrected) ledgers, and a
+        dictionary containing:
+            -   nonmonotonic (pd.DataFrame): Ledger updates where `sent` or
+                `recv` decreased.
+            -   lost (pd.Series): Number of transfers missing from each node's
+                log.
+            -   offsets (pd.Series): Estimated clock offset of each node, in
+                seconds.
+    """
+
+    nonmonotonic = checkMonotonic(ledgers)
+    for nodeId, n in nonmonotonic.groupby("id").size().items():
+        warn(f"node {nodeId} has {n} ledger updates with decreasing counters")
+
+    matched, lost = matchTransfers(ledgers)
+    for nodeId, n in lost[lost > 0].items():
+        warn(f"node {nodeId} is missing {n} transfers from its log")
+
+    offsets = clockOffsets(matched, ledgers["id"].unique())
+    if correctClocks:
+        ledgers = ledgers.copy()
+        ledgers["time"] = ledgers["time"] - pd.to_timedelta(
+            ledgers["id"].map(offsets), unit="s"
+        )
+
+    return (
+        ledgers,
+        {"nonmonotonic": nonmonotonic, "lost": lost, "offsets": offsets},
+    )
+
+
+def checkMonotonic(ledgers):
+    """
+    Get the ledger updates where a node's `sent` or `recv` counter for a peer
+    decreased since the node's previous update for that peer.
+    """
+    ledgers = ledgers.reset_index(drop=True)
+    pairs = ledgers.groupby(["id", "peer"], sort=False)
+    decreased = (pairs["sent"].diff() < 0) | (pairs["recv"].diff() < 0)
+    return ledgers[decreased]
+
+
+def matchTransfers(ledgers):
+    """
+    Match every `sent` value in the ledger of node i for node j with the
+    same `recv` value in the ledger of j for i. `ledgers` must be in the order
+    the updates were logged.
+
+    Returns:
+        (pd.DataFrame, pd.Series): The matched transfers, with the columns
+        src, dst, bytes and delay (the difference between the times dst and
+        src logged the transfer, in seconds), and the number of transfers
+        missing from each node's log.
+    """
+
+    # a transfer is logged as an update that only changes one of the
+    # counters. an update that changes both follows a lost update: one of its
+    # counters was changed by the transfer it logs and the other by the lost
+    # update, so the time it was logged is only meaningful for one of them
+    ledgers = ledgers.reset_index(drop=True)
+    pairs = ledgers.groupby(["id", "peer"], sort=False)
+    changed = {
+        counter: pairs[counter].diff().fillna(ledgers[counter]) != 0
+        for counter in ["sent", "recv"]
+    }
+    both = changed["sent"] & changed["recv"]
+
+    def firstTimes(counter, other):
+        # time each counter value was first logged
+        times = (
+            ledgers[changed[counter] & ~changed[other]]
+            .groupby(["id", "peer", counter], sort=False)["time"]
+            .min()
+            .reset_index()
+        )
+        return times.rename(columns={counter: "bytes"})
+
+    sends = firstTimes("sent", "recv").rename(columns={"id": "src", "peer": "dst"})
+    recvs = firstTimes("recv", "sent").rename(columns={"id": "dst", "peer": "src"})
+    transfers = sends.merge(
+        recvs, on=["src", "dst", "bytes"], how="outer", suffixes=("_src", "_dst")
+    )
+    sent = transfers["time_src"].notna()
+    recv = transfers["time_dst"].notna()
+
+    # only count values in the range logged by both nodes as missing, since
+    # either log may have been cut off earlier than the other
+    keys = [transfers["src"], transfers["dst"]]
+
+    def bound(logged, how):
+        return transfers["bytes"].where(logged).groupby(keys).transform(how)
+
+    lo = np.maximum(bound(sent, "min"), bound(recv, "min"))
+    hi = np.minimum(bound(sent, "max"), bound(recv, "max"))
+    inRange = (lo <= transfers["bytes"]) & (transfers["bytes"] <= hi)
+
+    # a transfer missing from the receiver's log was lost by the receiver,
+    # and vice versa. a sent value that was only logged by an update that
+    # changed both counters isn't missing: that update's lost counterpart is
+    # already counted by its recv value
+    ambiguous = (
+        ledgers.loc[both, ["id", "peer", "sent"]]
+        .set_axis(["src", "dst", "bytes"], axis=1)
+        .drop_duplicates()
+    )
+    ambiguous = transfers.merge(ambiguous, how="left", indicator=True)["_merge"]
+    ambiguous = (ambiguous == "both").values
+    lost = pd.concat(
+        [
+            transfers.loc[inRange & sent & ~recv, "dst"],
+            transfers.loc[inRange & recv & ~sent & ~ambiguous, "src"],
+        ]
+    ).value_counts()
+    nodes = pd.Index(ledgers["id"].unique())
+    lost = lost.reindex(nodes, fill_value=0)
+
+    matched = transfers[sent & recv].copy()
+    matched["delay"] = (matched["time_dst"] - matched["time_src"]).dt.total_seconds()
+    return matched[["src", "dst", "bytes", "delay"]], lost
+
+
+def clockOffsets(matched, nodes):
+    """
+    Estimate every node's clock offset from the delays of the matched
+    transfers (see matchTransfers()). For every pair of nodes i, j that
+    transferred data in both directions,
+
+        offset[j] - offset[i] = (median(delay i -> j) - median(delay j -> i)) / 2
+
+    and the offsets are the least squares solution of these equations, with
+    a mean of zero over the nodes they connect. Nodes without transfers in
+    both directions with any other node get an offset of zero.
+
+    Returns:
+        pd.Series: The offset of each node in `nodes`, in seconds.
+    """
+
+    offsets = pd.Series(0.0, index=pd.Index(nodes, name="id"))
+    delays = matched.groupby(["src", "dst"])["delay"].median()
+    reverse = delays.copy()
+    reverse.index = reverse.index.swaplevel()
+    skew = ((delays - reverse.reindex(delays.index)) / 2).dropna()
+    # each unordered pair gives the same equation twice
+    skew = skew[[src < dst for src, dst in skew.index]]
+    if len(skew) == 0:
+        return offsets
+
+    idx = {node: k for k, node in enumerate(offsets.index)}
+    incidence = np.zeros((len(skew), len(idx)))
+    rows = np.arange(len(skew))
+    incidence[rows, [idx[src] for src, _ in skew.index]] = -1
+    incidence[rows, [idx[dst] for _, dst in skew.index]] = 1
+    # lstsq returns the minimum norm solution, which has a zero mean over
+    # each connected set of nodes
+    solution = np.linalg.lstsq(incidence, skew.values, rcond=None)[0]
+    offsets[:] = solution
+    return offsets
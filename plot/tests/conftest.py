@@ -1,11 +1,86 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-    Dummy conftest.py for bitswap_test_plots.
+conftest.py for bitswap_test_plots.
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    https://pytest.org/latest/plugins.html
+The modules in src/bitswap_test_plots import each other as top-level
+modules (they are run as scripts), so put that directory on the path.
 """
 
-# import pytest
+import json
+import os.path
+import sys
+
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "src", "bitswap_test_plots")
+)
+
+
+def mkEvent(peer, time, sent, recv):
+    """
+    Make a ledger history entry, as logged by a node. `time` is in seconds
+    after 2019-01-01T00:00:00Z.
+    """
+    return {
+        "peer": peer,
+        "time": f"2019-01-01T00:00:{time:09.6f}Z",
+        "sent": sent,
+        "recv": recv,
+        "value": sent / (recv + 1),
+    }
+
+
+def mkNode(nodeId, history, **meta):
+    """
+    Make a node's entry of a results file.
+    """
+    return {
+        "id": nodeId,
+        "strategy": "identity",
+        "upload_bandwidth": "-1",
+        "round_burst": "10000",
+        "uploads": [{"cid": f"cid-{nodeId}"}],
+        "dl_times": [{"block": f"block-{nodeId}", "time": "10ms"}],
+        "history": history,
+        **meta,
+    }
+
+
+def mkMeshNodes(nodes, updates=5):
+    """
+    Make the entries of `nodes` nodes that each have `updates` ledger updates
+    for every other node.
+    """
+    ids = [f"node{i}" for i in range(nodes)]
+    return [
+        mkNode(
+            user,
+            [
+                mkEvent(peer, 0.1 * k + 0.01 * i, 10 * (k + 1) * (i + 1), k)
+                for k in range(updates)
+                for i, peer in enumerate(ids)
+                if peer != user
+            ],
+        )
+        for user in ids
+    ]
+
+
+@pytest.fixture
+def writeResults(tmp_path):
+    """
+    Write a list of nodes (see mkNode()) to a json results file and return its
+    path.
+    """
+
+    def write(nodes, name="results.json"):
+        fname = tmp_path / name
+        with open(fname, "w") as jfile:
+            json.dump(nodes, jfile)
+        return str(fname)
+
+    return write
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import pytest
+
+from app import getTRange
+
+
+@pytest.fixture
+def ledgers():
+    index = pd.MultiIndex.from_product(
+        [["a"], ["b"], [0.0, 1.0, 2.5, 5.0]], names=["id", "peer", "time"]
+    )
+    return pd.DataFrame({"value": [1.0, 2.0, 3.0, 4.0]}, index=index)
+
+
+def test_trange_full(ledgers):
+    assert list(getTRange(ledgers)) == [0.0, 5.0]
+
+
+def test_trange_bounds(ledgers):
+    assert list(getTRange(ledgers, trange=(0.5, 2.5))) == [1.0, 2.5]
+    assert list(getTRange(ledgers, prange=(0.25, 0.75))) == [1.0, 2.5]
+
+
+def test_trange_clamped_to_data(ledgers):
+    assert list(getTRange(ledgers, trange=(-10, 3))) == [0.0, 2.5]
+    assert list(getTRange(ledgers, trange=(2, 2000))) == [2.5, 5.0]
+    assert list(getTRange(ledgers, prange=(-0.5, 1.5))) == [0.0, 5.0]
+
+
+@pytest.mark.parametrize(
+    "kw",
+    [
+        {"trange": (1000, 2000)},
+        {"trange": (-2, -1)},
+        {"trange": (3, 4)},
+        {"trange": (5.0001, 5.0002)},
+        {"trange": (4, 3)},
+        {"prange": (1.5, 2)},
+    ],
+)
+def test_trange_without_updates(ledgers, kw):
+    with pytest.raises(ValueError):
+        getTRange(ledgers, **kw)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import sys
+
+import pytest
+
+import bench
+from bench import compare, loadBaseline, saveBaseline, BASELINE_VERSION
+
+
+def mkBaseline(stages):
+    return {"version": BASELINE_VERSION, "workloads": {"mesh-10": stages}}
+
+
+def stage(time, peak_mb=100.0):
+    return {"time": time, "peak_mb": peak_mb}
+
+
+@pytest.mark.parametrize(
+    "old, new, regressions",
+    [
+        # within the tolerance
+        (stage(1.0), stage(1.15), 0),
+        (stage(1.0), stage(0.5), 0),
+        # slower by more than the tolerance and --min-time
+        (stage(1.0), stage(1.3), 1),
+        # slower by more than the tolerance, but not by --min-time
+        (stage(0.01), stage(0.05), 0),
+        (stage(0.2), stage(0.29), 0),
+        (stage(0.2), stage(0.31), 1),
+        # more memory
+        (stage(1.0, 100), stage(1.0, 109), 0),
+        (stage(1.0, 100), stage(1.0, 111), 1),
+        # both only count once
+        (stage(1.0, 100), stage(2.0, 200), 1),
+    ],
+)
+def test_compare(capsys, old, new, regressions):
+    baseline = mkBaseline({"load": old})
+    results = {"mesh-10": {"load": new}}
+    assert compare(baseline, results, 0.2, 0.1, 0.1) == regressions
+    status = "REGRESSED" if regressions else "ok"
+    assert capsys.readouterr().out.rstrip().endswith(status)
+
+
+def test_compare_counts_every_stage(capsys):
+    baseline = mkBaseline({"load": stage(1.0), "plot-all": stage(1.0)})
+    results = {
+        "mesh-10": {"load": stage(2.0), "plot-all": stage(2.0)},
+        "mesh-50": {"load": stage(2.0)},
+    }
+    assert compare(baseline, results, 0.2, 0.1, 0.1) == 2
+    # stages the baseline doesn't have are shown, but aren't regressions
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert lines[2].startswith("mesh-50") and lines[2].endswith("(no baseline)")
+
+
+def test_compare_new_stage(capsys):
+    baseline = mkBaseline({"load": stage(1.0)})
+    results = {"mesh-10": {"load": stage(1.0), "plot-pairs": stage(60.0)}}
+    assert compare(baseline, results, 0.2, 0.1, 0.1) == 0
+    assert "plot-pairs" in capsys.readouterr().out
+
+
+def test_baseline_round_trip(tmp_path):
+    fname = str(tmp_path / "benchmarks" / "baseline.json")
+    results = {"mesh-10": {"load": stage(1.0)}}
+    saveBaseline(results, 3, fname)
+    baseline = loadBaseline(fname)
+    assert baseline["workloads"] == results
+    assert baseline["repeat"] == 3
+
+
+def test_baseline_version(tmp_path):
+    fname = tmp_path / "baseline.json"
+    with open(fname, "w") as jfile:
+        json.dump({"version": BASELINE_VERSION + 1, "workloads": {}}, jfile)
+    with pytest.raises(ValueError, match="re-record"):
+        loadBaseline(str(fname))
+
+
+def test_compare_without_baseline(tmp_path, monkeypatch, capsys):
+    fname = str(tmp_path / "baseline.json")
+    monkeypatch.setattr(sys, "argv", ["bench.py", "-b", fname, "compare"])
+    with pytest.raises(SystemExit) as e:
+        bench.run()
+    assert e.value.code == 3
+    assert "no baseline recorded" in capsys.readouterr().err
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import mkEvent, mkNode
+from chunked import (
+    iterNodes,
+    iterChunks,
+    aggregate,
+    combineStats,
+    combineSeries,
+    loadChunked,
+)
+
+
+@pytest.fixture
+def nodes():
+    history = {"a": [], "b": []}
+    for k in range(50):
+        history["a"].append(mkEvent("b", 0.3 * k, 10 * (k + 1), 3 * k))
+        history["b"].append(mkEvent("a", 0.3 * k + 0.01, 3 * k, 10 * (k + 1)))
+    return [mkNode(nodeId, h) for nodeId, h in history.items()]
+
+
+@pytest.mark.parametrize("blocksize", [1, 7, 64, 2**20])
+def test_iter_nodes_across_blocks(writeResults, nodes, blocksize):
+    fname = writeResults(nodes)
+    assert list(iterNodes(fname, blocksize=blocksize)) == nodes
+
+
+def test_iter_nodes_whitespace(tmp_path, nodes):
+    fname = tmp_path / "results.json"
+    fname.write_text(json.dumps(nodes, indent=4) + "\n")
+    assert list(iterNodes(str(fname), blocksize=5)) == nodes
+
+
+def test_iter_nodes_truncated(tmp_path, nodes):
+    fname = tmp_path / "results.json"
+    fname.write_text(json.dumps(nodes)[:-20])
+    with pytest.raises(json.JSONDecodeError):
+        list(iterNodes(str(fname), blocksize=64))
+
+
+def test_iter_nodes_not_a_list(tmp_path):
+    fname = tmp_path / "results.json"
+    fname.write_text('{"id": "a"}')
+    with pytest.raises(ValueError):
+        list(iterNodes(str(fname)))
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 20])
+def test_combine_matches_single_pass(nodes, chunksize):
+    history = nodes[0]["history"]
+    (chunk,) = iterChunks("a", history, len(history))
+    stats, series = aggregate(chunk, 1.0)
+
+    partials = [aggregate(c, 1.0) for c in iterChunks("a", history, chunksize)]
+    combined = combineStats([s for s, _ in partials])
+    pd.testing.assert_frame_equal(combined, stats, check_like=True)
+    pd.testing.assert_frame_equal(combineSeries([d for _, d in partials]), series)
+
+
+def test_load_chunked_independent_of_chunksize(writeResults, nodes):
+    fname = writeResults(nodes)
+    whole = loadChunked(fname, 1.0, 1000)
+    chunked = loadChunked(fname, 1.0, 3)
+    pd.testing.assert_frame_equal(chunked["ledgers"], whole["ledgers"])
+    pd.testing.assert_frame_equal(chunked["stats"], whole["stats"], check_like=True)
+    assert chunked["drstats"] == pytest.approx(whole["drstats"])
+    # 15 seconds of updates in 1 second buckets
+    assert len(whole["ledgers"].loc["a"]) == 15
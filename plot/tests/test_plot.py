@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import warnings
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from conftest import mkEvent, mkNode, mkMeshNodes
+from app import load, secondsIndex, getTRange
+from plot import (
+    plot,
+    iterPages,
+    plotHeatmap,
+    mkPlotConfig,
+    mkColorPairs,
+    mkAxes,
+    numPages,
+    axisLimits,
+    COLOR_PAIRS,
+)
+
+
+def mkMesh(writeResults, nodes, updates=5):
+    """
+    Load the results of `nodes` nodes: either the nodes themselves (see
+    mkNode()) or the number of nodes to make with mkMeshNodes().
+    """
+    if isinstance(nodes, int):
+        nodes = mkMeshNodes(nodes, updates)
+    results = load(writeResults(nodes))
+    results["ledgers"] = secondsIndex(results["ledgers"])
+    return results
+
+
+def mkHeatmapResults(writeResults):
+    # (time, debt ratio) of each pair's updates
+    history = {
+        ("a", "b"): [(0, 10), (1, 20), (4, 30), (10, 40)],
+        ("b", "a"): [(0.5, 1), (6, 2)],
+        ("c", "a"): [(2, 5)],
+    }
+    nodes = {}
+    for (user, peer), updates in history.items():
+        nodes.setdefault(user, []).extend(
+            mkEvent(peer, t, value, 0) for t, value in updates
+        )
+    return mkMesh(writeResults, [mkNode(user, h) for user, h in nodes.items()])
+
+
+def heatmap(results, trange, bins=5):
+    """
+    Get the matrix of the heatmap of `results`, and its row labels.
+    """
+    ledgers = results["ledgers"]
+    cfg = mkPlotConfig(ledgers, trange, results["params"], "heatmap", bins=bins)
+    fig = plotHeatmap(ledgers, trange, cfg)
+    ax = fig.axes[0]
+    matrix = ax.images[0].get_array().filled(np.nan)
+    return matrix, [label.get_text() for label in ax.get_yticklabels()], ax
+
+
+@pytest.fixture(autouse=True)
+def closeFigures():
+    yield
+    plt.close("all")
+
+
+@pytest.mark.parametrize("kind", ["all", "pairs"])
+def test_config_more_than_three_pairs(writeResults, kind):
+    results = mkMesh(writeResults, 5)
+    ledgers = results["ledgers"]
+    cfg = mkPlotConfig(ledgers, getTRange(ledgers), results["params"], kind)
+    assert cfg["pairs"] == 10
+    assert len(cfg["colorMap"]) == 20
+    for (user, peer), colors in cfg["colorMap"].items():
+        assert cfg["colorMap"][peer, user] == colors[::-1]
+
+
+@pytest.mark.parametrize("n", [1, 3, 4, 10, 45])
+def test_color_pairs_are_distinct(n):
+    pairs = mkColorPairs(n)
+    assert len(pairs) == n
+    colors = [c for pair in pairs for c in pair]
+    assert len(set(colors)) == 2 * n
+    if n <= len(COLOR_PAIRS):
+        assert pairs == COLOR_PAIRS[:n]
+
+
+def test_pairs_axes(writeResults):
+    results = mkMesh(writeResults, 4)
+    ledgers = results["ledgers"]
+    trange = getTRange(ledgers)
+    cfg = mkPlotConfig(ledgers, trange, results["params"], "pairs")
+    assert cfg["num_axes"] == 6
+    # both orders of a pair share an axis, and every pair gets its own
+    for (user, peer), k in cfg["axisMap"].items():
+        assert cfg["axisMap"][peer, user] == k
+    assert sorted(set(cfg["axisMap"].values())) == list(range(6))
+    assert cfg["axisTitles"] == [
+        "Users 0 and 1",
+        "Users 0 and 2",
+        "Users 0 and 3",
+        "Users 1 and 2",
+        "Users 1 and 3",
+        "Users 2 and 3",
+    ]
+    assert cfg["axisTitles"][cfg["axisMap"]["node1", "node3"]] == "Users 1 and 3"
+
+    cfg = mkPlotConfig(ledgers, trange, results["params"], "all")
+    assert cfg["num_axes"] == 1
+    assert set(cfg["axisMap"].values()) == {0}
+    assert cfg["axisTitles"] == []
+
+
+@pytest.mark.parametrize(
+    "n, grid, pages, shape",
+    [
+        (1, (3, 2), 1, (1, 1)),
+        (3, (3, 2), 1, (2, 2)),
+        (6, (3, 2), 1, (3, 2)),
+        (7, (3, 2), 2, (3, 2)),
+        (13, (3, 2), 3, (3, 2)),
+        (5, (1, 1), 5, (1, 1)),
+        (4, (2, 8), 1, (1, 4)),
+    ],
+)
+def test_page_counts(n, grid, pages, shape):
+    assert numPages({"num_axes": n, "grid": grid}) == pages
+    titles = [f"plot {k}" for k in range(n)]
+    figs, axes = mkAxes(n, grid, "title", titles)
+    assert len(figs) == pages
+    assert list(axes) == list(range(n))
+    rows, cols = shape
+    assert axes[0].get_subplotspec().get_gridspec().get_geometry() == (rows, cols)
+
+    # only the requested page is made, with the same sub-plot indices
+    figs, axes = mkAxes(n, grid, "title", titles, pages=[pages - 1])
+    assert len(figs) == 1
+    assert list(axes) == list(range((pages - 1) * rows * cols, n))
+    if n > 1:
+        assert [ax.get_title() for ax in axes.values()] == titles[-len(axes) :]
+
+
+@pytest.mark.parametrize("log", [False, True])
+def test_pages_share_limits(writeResults, log):
+    results = mkMesh(writeResults, 5)
+    ledgers = results["ledgers"]
+    trange = getTRange(ledgers)
+    cfg = mkPlotConfig(ledgers, trange, results["params"], "pairs", grid=(2, 2))
+    assert numPages(cfg) == 3
+
+    xlim, ylim = axisLimits(ledgers, log=log)
+    time = ledgers.index.get_level_values(2)
+    assert xlim[0] < time.min() and time.max() < xlim[1]
+    assert ylim[0] <= ledgers["value"].min() and ledgers["value"].max() < ylim[1]
+    if log:
+        assert ylim[0] == 0
+
+    for page in range(3):
+        (fig,) = iterPages(ledgers, trange, cfg, log=log, pages=[page])
+        for ax in fig.axes:
+            assert ax.get_xlim() == pytest.approx(xlim)
+            assert ax.get_ylim() == pytest.approx(ylim)
+        plt.close(fig)
+
+
+def test_plot_streams_pages(writeResults, tmp_path):
+    results = mkMesh(writeResults, 5)
+    ledgers = results["ledgers"]
+    trange = getTRange(ledgers)
+    cfg = mkPlotConfig(
+        ledgers,
+        trange,
+        results["params"],
+        "pairs",
+        fdir=str(tmp_path),
+        fbasename="pairs",
+    )
+
+    # each page is made only once the previous one has been used
+    for fig in iterPages(ledgers, trange, cfg):
+        assert plt.get_fignums() == [fig.number]
+        plt.close(fig)
+
+    assert plot(ledgers, trange, cfg, keep=False) == ([], [])
+    assert plt.get_fignums() == []
+    for fname in ["pairs.pdf", "pairs-semilog.pdf"]:
+        with open(tmp_path / fname, "rb") as pdf:
+            assert pdf.read().count(b"/Type /Page ") == numPages(cfg)
+
+    figs, figsLog = plot(ledgers, trange, cfg)
+    assert len(figs) == len(figsLog) == numPages(cfg) == 2
+    assert len(plt.get_fignums()) == 4
+    assert os.path.getsize(tmp_path / "pairs.pdf") > 0
+
+
+def test_heatmap_buckets(writeResults):
+    matrix, labels, _ = heatmap(mkHeatmapResults(writeResults), (0, 10))
+    # peers a and b are 0 and 1, and users a, b and c are 0, 1 and 2
+    assert labels == ["1 wrt 0", "0 wrt 1", "0 wrt 2"]
+    nan = np.nan
+    # 2s wide buckets, where t == 10 is in the last one, and empty buckets
+    # carry the last value forward
+    np.testing.assert_array_equal(
+        matrix,
+        [
+            [20, 20, 30, 30, 40],
+            [1, 1, 1, 2, 2],
+            [nan, 5, 5, 5, 5],
+        ],
+    )
+
+
+def test_heatmap_starts_from_value_before_trange(writeResults):
+    matrix, labels, _ = heatmap(mkHeatmapResults(writeResults), (5, 10))
+    assert labels == ["1 wrt 0", "0 wrt 1", "0 wrt 2"]
+    # c has no updates in the range, but its debt ratio from t = 2 still holds
+    np.testing.assert_array_equal(
+        matrix,
+        [
+            [30, 30, 30, 30, 40],
+            [1, 2, 2, 2, 2],
+            [5, 5, 5, 5, 5],
+        ],
+    )
+
+
+def test_heatmap_of_an_instant(writeResults):
+    results = mkHeatmapResults(writeResults)
+    # e.g. matplotlib's "Attempting to set identical low and high xlims"
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", UserWarning)
+        matrix, labels, ax = heatmap(results, (4, 4))
+        ax.figure.canvas.draw()
+    assert ax.get_xlim() == (3.5, 4.5)
+    assert labels == ["1 wrt 0", "0 wrt 1", "0 wrt 2"]
+    np.testing.assert_array_equal(matrix, [[30] * 5, [1] * 5, [5] * 5])
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import matplotlib.pyplot as plt
+import pytest
+
+import plot
+from conftest import mkEvent, mkNode, mkMeshNodes
+from server import LRUCache, PlotServer, BadRequest, parseQuery
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(10, len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    # using a makes b the least recently used entry
+    assert cache.get("a") == "xxxx"
+    cache.put("c", "xxxx")
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.size == 8
+
+
+def test_lru_evicts_until_under_budget():
+    cache = LRUCache(10, len)
+    for key in "abcde":
+        cache.put(key, "xx")
+    cache.put("f", "xxxxxxx")
+    assert list(cache.entries) == ["e", "f"]
+    assert cache.size == 9 <= cache.budget
+
+
+def test_lru_replaces_existing_key():
+    cache = LRUCache(10, len)
+    cache.put("a", "xxxxxx")
+    cache.put("a", "xxx")
+    assert len(cache) == 1
+    assert cache.size == 3
+
+
+def test_lru_does_not_cache_values_over_budget():
+    cache = LRUCache(10, len)
+    cache.put("a", "xx")
+    assert cache.put("b", "x" * 11) == "x" * 11
+    assert "b" not in cache
+    assert "a" in cache
+    assert cache.get("b") is None
+
+
+def test_parse_query_defaults():
+    assert parseQuery({"file": ["r.json"]}) == {
+        "fname": "r.json",
+        "kind": "all",
+        "scale": "linear",
+        "fmt": "png",
+        "page": 0,
+        "prange": None,
+        "trange": None,
+    }
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"file": ["a.json", "b.json"]},
+        {"file": ["r.json"], "kind": ["bogus"]},
+        {"file": ["r.json"], "scale": ["cubic"]},
+        {"file": ["r.json"], "format": ["svg"]},
+        {"file": ["r.json"], "page": ["-1"]},
+        {"file": ["r.json"], "page": ["one"]},
+        {"file": ["r.json"], "trange": ["1"]},
+        {"file": ["r.json"], "trange": ["a,b"]},
+        {"file": ["r.json"], "prange": ["0,1"], "trange": ["0,1"]},
+    ],
+)
+def test_parse_query_errors(query):
+    with pytest.raises(BadRequest):
+        parseQuery(query)
+
+
+def test_render_empty_trange_is_bad_request(writeResults, tmp_path):
+    writeResults(
+        [
+            mkNode("a", [mkEvent("b", 0, 1, 0), mkEvent("b", 5, 2, 0)]),
+            mkNode("b", [mkEvent("a", 0, 0, 1), mkEvent("a", 5, 0, 2)]),
+        ]
+    )
+    server = PlotServer(str(tmp_path), 2**20, 2**20, ("127.0.0.1", 0))
+    try:
+        for trange in [(1000, 2000), (1, 2)]:
+            with pytest.raises(BadRequest):
+                server.render("results.json", "all", "linear", "json", trange=trange)
+        out = server.render("results.json", "all", "linear", "json", trange=(0, 1))
+        assert b'"trange": [0.0, 0.0]' in out
+    finally:
+        server.server_close()
+
+
+def test_render_only_requested_page(writeResults, tmp_path, monkeypatch):
+    # 10 pairs make 2 pages
+    writeResults(mkMeshNodes(5))
+    made = []
+    mkAxes = plot.mkAxes
+
+    def recordAxes(*args, log=False, pages=None):
+        made.append((log, pages))
+        return mkAxes(*args, log=log, pages=pages)
+
+    monkeypatch.setattr(plot, "mkAxes", recordAxes)
+    server = PlotServer(str(tmp_path), 2**20, 2**20, ("127.0.0.1", 0))
+    try:
+        out = server.render("results.json", "pairs", "log", "png", page=1)
+        assert out.startswith(b"\x89PNG")
+        assert made == [(True, [1])]
+        assert plt.get_fignums() == []
+
+        # cached
+        assert server.render("results.json", "pairs", "log", "png", page=1) == out
+        assert made == [(True, [1])]
+
+        # PDFs have every page of one scale
+        made.clear()
+        out = server.render("results.json", "pairs", "linear", "pdf")
+        assert out.count(b"/Type /Page ") == 2
+        assert made == [(False, [0]), (False, [1])]
+        assert plt.get_fignums() == []
+
+        with pytest.raises(BadRequest):
+            server.render("results.json", "pairs", "log", "png", page=2)
+    finally:
+        server.server_close()
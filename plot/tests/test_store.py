@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import mkEvent, mkNode
+from chunked import loadChunked, iterChunks
+from plot import mkPlotConfig
+from app import getTRange
+from store import (
+    openStore,
+    readState,
+    importResults,
+    appendLog,
+    newerThan,
+    loadStore,
+    STATE,
+)
+
+
+def mkHistory(peer, n, start=0, dt=0.3):
+    return [mkEvent(peer, dt * k, 10 * (k + 1), k) for k in range(start, n)]
+
+
+def writeLog(fname, events, mode="w"):
+    with open(fname, mode) as logfile:
+        for e in events:
+            logfile.write(json.dumps({"event": "DebtRatio", **e}) + "\n")
+
+
+def assertSameLedgers(results, expected):
+    pd.testing.assert_frame_equal(
+        results["ledgers"].sort_index(), expected["ledgers"].sort_index()
+    )
+
+
+def test_load_store_does_not_create(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        loadStore(str(tmp_path))
+    assert not os.path.exists(tmp_path / STATE)
+    with pytest.raises(FileNotFoundError):
+        readState(str(tmp_path / "missing"))
+
+
+def test_newer_than_high_water_mark():
+    (chunk,) = iterChunks("a", mkHistory("b", 5), 10)
+    stats = pd.DataFrame(
+        {"time": [chunk["time"][2]]},
+        index=pd.MultiIndex.from_tuples([("a", "b")], names=["id", "peer"]),
+    )
+    assert newerThan(chunk, None) is chunk
+    assert list(newerThan(chunk, stats)["sent"]) == [40, 50]
+    # pairs without a high-water mark are kept
+    (other,) = iterChunks("a", mkHistory("c", 5), 10)
+    assert len(newerThan(other, stats)) == 5
+
+
+def test_overlapping_imports(tmp_path, writeResults):
+    full = [mkNode("a", mkHistory("b", 40)), mkNode("b", mkHistory("a", 40))]
+    part = [mkNode("a", mkHistory("b", 25)), mkNode("b", mkHistory("a", 10))]
+    store = str(tmp_path / "store")
+    state = openStore(store)
+    assert importResults(store, state, writeResults(part, "part.json")) == 35
+    # only the updates after each pair's high-water mark are appended
+    assert importResults(store, state, writeResults(full, "full.json")) == 45
+    assert importResults(store, state, writeResults(full, "full.json")) == 0
+
+    results = loadStore(store)
+    expected = loadChunked(str(tmp_path / "full.json"))
+    assertSameLedgers(results, expected)
+    pd.testing.assert_frame_equal(
+        results["stats"].sort_index(), expected["stats"].sort_index(), check_like=True
+    )
+    with open(tmp_path / "store" / "ledgers_a.jsonl") as jfile:
+        assert len(jfile.readlines()) == 40
+
+
+def test_append_log_resume(tmp_path, writeResults):
+    history = mkHistory("b", 30)
+    log = tmp_path / "a.log"
+    writeLog(log, history[:10])
+    # a last line that is still being written
+    partial = json.dumps({"event": "DebtRatio", **history[10]})
+    with open(log, "a") as logfile:
+        logfile.write(partial[:15])
+
+    store = str(tmp_path / "store")
+    state = openStore(store)
+    assert appendLog(store, state, "a", str(log)) == 10
+    assert list(state["offsets"]["a"].values()) == [os.path.getsize(log) - 15]
+    assert readState(store)["offsets"] == state["offsets"]
+
+    with open(log, "a") as logfile:
+        logfile.write(partial[15:] + "\n")
+    writeLog(log, history[11:], mode="a")
+    assert appendLog(store, state, "a", str(log)) == 20
+    assert appendLog(store, state, "a", str(log)) == 0
+    assert list(state["offsets"]["a"].values()) == [os.path.getsize(log)]
+
+    # a truncated log is read from the start, skipping what's already stored
+    writeLog(log, history[:5])
+    assert appendLog(store, state, "a", str(log)) == 0
+    assert list(state["offsets"]["a"].values()) == [os.path.getsize(log)]
+
+    expected = loadChunked(writeResults([mkNode("a", history)]))
+    assertSameLedgers(loadStore(store), expected)
+
+
+def test_append_two_logs(tmp_path, writeResults):
+    logs = {"b": tmp_path / "a-b.log", "c": tmp_path / "a-c.log"}
+    history = {"b": mkHistory("b", 10), "c": mkHistory("c", 20)}
+    for peer, log in logs.items():
+        writeLog(log, history[peer])
+
+    store = str(tmp_path / "store")
+    state = openStore(store)
+    # each log is read from its own start
+    assert appendLog(store, state, "a", str(logs["b"])) == 10
+    assert appendLog(store, state, "a", str(logs["c"])) == 20
+    assert sorted(state["offsets"]["a"].values()) == sorted(
+        os.path.getsize(log) for log in logs.values()
+    )
+    # and then from where it stopped
+    writeLog(logs["b"], mkHistory("b", 15, start=10), mode="a")
+    assert appendLog(store, state, "a", str(logs["c"])) == 0
+    assert appendLog(store, state, "a", str(logs["b"])) == 5
+
+    expected = loadChunked(
+        writeResults([mkNode("a", mkHistory("b", 15) + history["c"])])
+    )
+    assertSameLedgers(loadStore(store), expected)
+
+
+def test_append_restarted_log(tmp_path, writeResults):
+    history = mkHistory("b", 40)
+    log = tmp_path / "a.log"
+    writeLog(log, history[:10])
+    store = str(tmp_path / "store")
+    state = openStore(store)
+    assert appendLog(store, state, "a", str(log)) == 10
+
+    # the restarted node's log is already longer than the old one was
+    writeLog(log, history[10:])
+    assert appendLog(store, state, "a", str(log)) == 30
+    assert appendLog(store, state, "a", str(log)) == 0
+
+    expected = loadChunked(writeResults([mkNode("a", history)]))
+    assertSameLedgers(loadStore(store), expected)
+
+
+def test_store_without_metadata(tmp_path):
+    log = tmp_path / "a.log"
+    writeLog(log, mkHistory("b", 10))
+    store = str(tmp_path / "store")
+    appendLog(store, openStore(store), "a", str(log))
+
+    results = loadStore(store)
+    ledgers = results["ledgers"]
+    cfg = mkPlotConfig(ledgers, getTRange(ledgers), results["params"], "all")
+    assert cfg["title"] == "Debt Ratio vs. Time"
+
+
+def test_incremental_load(tmp_path, writeResults):
+    history = {"a": mkHistory("b", 60), "b": mkHistory("a", 60)}
+    store = str(tmp_path / "store")
+    state = openStore(store)
+
+    results = None
+    for end in [20, 35, 60]:
+        nodes = [mkNode(nodeId, h[:end]) for nodeId, h in history.items()]
+        importResults(store, state, writeResults(nodes))
+        results = loadStore(store, results)
+        assertSameLedgers(results, loadStore(store))
+        assert results["files"]["a"][1] == os.path.getsize(
+            os.path.join(store, "series_a.jsonl")
+        )
+
+    expected = loadChunked(writeResults([mkNode(i, h) for i, h in history.items()]))
+    assertSameLedgers(results, expected)
+
+
+def test_compaction(tmp_path, writeResults):
+    # with 100s buckets, every append of one update replaces the last bucket
+    history = mkHistory("b", 30)
+    store = str(tmp_path / "store")
+    state = openStore(store, resolution=100.0)
+
+    results = None
+    for end in range(1, len(history) + 1):
+        importResults(store, state, writeResults([mkNode("a", history[:end])]))
+        results = loadStore(store, results)
+        assertSameLedgers(results, loadStore(store))
+
+    dead, lines = state["dead"]["a"]
+    assert dead <= lines // 2
+    with open(os.path.join(store, "series_a.jsonl")) as jfile:
+        # the header and at most twice as many lines as buckets
+        assert len(jfile.readlines()) <= 1 + 2
+    expected = loadChunked(writeResults([mkNode("a", history)]), resolution=100.0)
+    assertSameLedgers(results, expected)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+
+import pandas as pd
+import pytest
+
+from validate import validate
+
+T0 = pd.Timestamp("2019-01-01", tz="UTC")
+LATENCY = 0.01
+
+
+def simulate(nodes, transfers, skew=None, seed=0):
+    """
+    Simulate `transfers` transfers between random pairs of `nodes`, each of
+    which is logged by the sender and, LATENCY seconds later, by the receiver.
+
+    Returns:
+        dict{str: [dict]}: Each node's ledger updates, in the order they were
+        logged, with times shifted by the node's clock offset in `skew`.
+    """
+
+    rng = random.Random(seed)
+    skew = skew or {}
+    sent = {}
+    logs = {node: [] for node in nodes}
+
+    def log(node, peer, t):
+        logs[node].append(
+            {
+                "id": node,
+                "peer": peer,
+                "time": T0 + pd.Timedelta(t + skew.get(node, 0), unit="s"),
+                "sent": sent.get((node, peer), 0),
+                "recv": sent.get((peer, node), 0),
+            }
+        )
+
+    for k in range(transfers):
+        src, dst = rng.sample(nodes, 2)
+        sent[src, dst] = sent.get((src, dst), 0) + rng.randint(1, 1000)
+        log(src, dst, k)
+        log(dst, src, k + LATENCY)
+    return logs
+
+
+def frame(logs):
+    return pd.DataFrame.from_records([u for log in logs.values() for u in log])
+
+
+def test_consistent_logs():
+    logs = simulate(["a", "b", "c"], 200)
+    ledgers, v = validate(frame(logs))
+    assert (v["lost"] == 0).all()
+    assert len(v["nonmonotonic"]) == 0
+    assert v["offsets"].abs().max() == pytest.approx(0, abs=1e-9)
+    pd.testing.assert_frame_equal(ledgers, frame(logs))
+
+
+@pytest.mark.parametrize("node", ["a", "b"])
+def test_dropped_lines(node):
+    logs = simulate(["a", "b"], 200)
+    # drop non-adjacent lines from the middle of one node's log. the update
+    # after each dropped one changes both counters
+    dropped = [20, 50, 51 + 30, 140]
+    logs[node] = [u for k, u in enumerate(logs[node]) if k not in dropped]
+    _, v = validate(frame(logs))
+    assert v["lost"][node] == len(dropped)
+    assert v["lost"].sum() == len(dropped)
+
+
+def test_dropped_lines_on_both_sides():
+    logs = simulate(["a", "b", "c"], 300)
+    for node, dropped in [("a", [10, 80]), ("c", [30, 90, 150])]:
+        logs[node] = [u for k, u in enumerate(logs[node]) if k not in dropped]
+    _, v = validate(frame(logs))
+    assert v["lost"].to_dict() == {"a": 2, "b": 0, "c": 3}
+
+
+@pytest.mark.parametrize("cut", [slice(None, 120), slice(40, None)])
+def test_cut_off_log_is_not_lost(cut):
+    logs = simulate(["a", "b"], 200)
+    logs["b"] = logs["b"][cut]
+    _, v = validate(frame(logs))
+    assert (v["lost"] == 0).all()
+
+
+def test_clock_skew():
+    nodes = ["a", "b", "c", "d"]
+    logs = simulate(nodes, 400, skew={"c": 1.5})
+    ledgers, v = validate(frame(logs))
+    # offset[j] - offset[i] is c's skew for every pair with c, and the
+    # offsets have a mean of zero
+    assert list(v["offsets"]) == pytest.approx([-0.375, -0.375, 1.125, -0.375])
+    assert list(v["offsets"].index) == nodes
+    # without correction, the times are left alone
+    pd.testing.assert_frame_equal(ledgers, frame(logs))
+
+
+def test_clock_skew_correction():
+    logs = simulate(["a", "b", "c"], 300, skew={"a": -0.25, "b": 0.75})
+    ledgers, v = validate(frame(logs), correctClocks=True)
+    # every clock is corrected to the mean of the clocks
+    mean = (-0.25 + 0.75) / 3
+    expected = frame(simulate(["a", "b", "c"], 300, skew=dict.fromkeys("abc", mean)))
+    assert (ledgers["time"] - expected["time"]).abs().max() < pd.Timedelta(1, "us")
+    _, corrected = validate(ledgers)
+    assert corrected["offsets"].abs().max() == pytest.approx(0, abs=1e-6)
+
+
+def test_one_way_transfers_have_no_offset():
+    # b's clock is 2s ahead, but there is no b -> a transfer to tell that
+    # apart from latency
+    ledgers = pd.DataFrame.from_records(
+        [
+            {"id": "a", "peer": "b", "time": T0, "sent": 10, "recv": 0},
+            {
+                "id": "b",
+                "peer": "a",
+                "time": T0 + pd.Timedelta(2, "s"),
+                "sent": 0,
+                "recv": 10,
+            },
+        ]
+    )
+    _, v = validate(ledgers)
+    assert (v["lost"] == 0).all()
+    assert (v["offsets"] == 0).all()
+
+
+def test_decreasing_counter(capsys):
+    logs = simulate(["a", "b"], 100)
+    logs["a"][30] = {**logs["a"][30], "sent": 0}
+    _, v = validate(frame(logs))
+    assert list(v["nonmonotonic"]["id"]) == ["a"]
+    assert v["nonmonotonic"].iloc[0]["time"] == logs["a"][30]["time"]
+    assert "node a has 1 ledger updates with decreasing counters" in (
+        capsys.readouterr().err
+    )
@@ -3,4 +3,5 @@
 set -ex
 
 # ./test.sh -t 2 -n 3 -s "identity" -r 10000 -f 'head -c 10000000 /dev/urandom' -d 'test-run'
+# ./sweep.sh -t 2 -n 3 -s "identity" -b "5000,-1" -r "1000,10000" -f 'head -c 10000000 /dev/urandom' -d 'test-run'
 ./test.sh -t 2 -n 3 -s "identity" -b 5000 -r "10000 10000 10000" -f 'head -c 10000000 /dev/urandom' -d 'test-run'
@@ -0,0 +1,235 @@
+#!/bin/bash
+
+# Run test.sh for every point of a parameter grid. Each grid axis is a
+# comma-separated list of values, where each value is passed as-is to the
+# corresponding test.sh option (so it may itself be a space-separated list of
+# per-node values). Points whose results file already exists and is valid are
+# skipped, so an interrupted sweep can be resumed by re-running it.
+
+usage="\
+./sweep.sh [-h] -t TEST_NUM -n NUM_NODES -f FILE_CMD
+           [-s STRATEGY[,STRATEGY ...] -r ROUND_BURST[,ROUND_BURST ...]]
+           [-b UPLOAD_BANDWIDTH[,UPLOAD_BANDWIDTH ...]] [-d RESULTS_DIR]
+           [-S SHARD/NUM_SHARDS] [-j JOBS] [-l]
+
+  -S  only run the points of the grid with index SHARD modulo NUM_SHARDS
+      (e.g. to split a sweep across hosts)
+  -j  run JOBS shards in parallel on this host, each on its own iptb cluster
+  -l  list the points of the grid and whether they're done, without running"
+
+test_sh="${TEST_SH:-./test.sh}"
+shard=0
+num_shards=1
+jobs=1
+
+while getopts "t:n:f:d:b:r:s:S:j:lh" opt; do
+    case $opt in
+        t)
+            test_num="$OPTARG"
+            ;;
+        n)
+            num_nodes="$OPTARG"
+            ;;
+        f)
+            file_cmd="$OPTARG"
+            ;;
+        b)
+            IFS=',' read -r -a bw_grid <<< "$OPTARG"
+            ;;
+        r)
+            IFS=',' read -r -a rb_grid <<< "$OPTARG"
+            ;;
+        s)
+            IFS=',' read -r -a strategy_grid <<< "$OPTARG"
+            ;;
+        d)
+            results_dir="$OPTARG"
+            ;;
+        S)
+            shard="${OPTARG%/*}"
+            num_shards="${OPTARG#*/}"
+            ;;
+        j)
+            jobs="$OPTARG"
+            ;;
+        l)
+            list=1
+            ;;
+        h)
+            echo "$usage"
+            exit 0
+            ;;
+        *)
+            echo "$usage" >&2
+            exit 1
+            ;;
+    esac
+done
+shift $((OPTIND-1))
+
+if [[ -z "$test_num" || -z "$num_nodes" || -z "$file_cmd" ]]; then
+    echo "missing required arguments" >&2
+    echo "$usage" >&2
+    exit 1
+fi
+results_dir="${results_dir:-.}"
+if ! [[ "$shard" =~ ^[0-9]+$ && "$num_shards" =~ ^[0-9]+$ ]] || ((shard >= num_shards)); then
+    echo "error: invalid shard $shard/$num_shards" >&2
+    exit 1
+fi
+if ! [[ "$jobs" =~ ^[0-9]+$ ]] || ((jobs < 1)); then
+    echo "error: invalid number of jobs $jobs" >&2
+    exit 1
+fi
+
+if ((${#rb_grid[@]} > 0 && ${#strategy_grid[@]} == 0)); then
+    # test.sh ignores round bursts without strategies, so every round burst
+    # would write the same results file
+    echo "error: -r requires -s" >&2
+    exit 1
+fi
+if ((${#strategy_grid[@]} > 0 && ${#rb_grid[@]} == 0)); then
+    # test.sh fails if strategies are given without round bursts
+    echo "error: -s requires -r" >&2
+    exit 1
+fi
+
+# an axis that isn't swept has a single empty value, meaning the option isn't
+# passed to test.sh
+((${#strategy_grid[@]} > 0)) || strategy_grid=("")
+((${#rb_grid[@]} > 0)) || rb_grid=("")
+((${#bw_grid[@]} > 0)) || bw_grid=("")
+
+# expand a (space-separated) per-node value list to one value per node, the
+# same way test.sh does
+expand() {
+    local vals i
+    IFS=' ' read -r -a vals <<< "$1"
+    if ((${#vals[@]} == 1)); then
+        for ((i=0; i < num_nodes; i++)); do echo "${vals[0]}"; done
+    else
+        printf '%s\n' "${vals[@]}"
+    fi
+}
+
+# get the results file test.sh writes for a point (see results_prefix in
+# test.sh)
+results_file() {
+    local strategies="$1" round_bursts="$2" bw_dist="$3"
+    local prefix="$results_dir/"
+    if [[ -n "$strategies" ]]; then
+        prefix+="$(expand "$strategies" | head -n1)-"
+        if [[ -n "$round_bursts" ]]; then
+            prefix+="rb_$(expand "$round_bursts" | paste -sd_)-"
+        fi
+    fi
+    if [[ -n "$bw_dist" ]]; then
+        prefix+="bw_$(expand "$bw_dist" | paste -sd_)-"
+    fi
+    echo "${prefix%?}.json"
+}
+
+# test.sh only names results files after the first node's strategy, so make
+# sure that distinct points don't share a results file
+declare -A points
+k=-1
+for s in "${strategy_grid[@]}"; do
+    for rb in "${rb_grid[@]}"; do
+        for bw in "${bw_grid[@]}"; do
+            ((k++))
+            outfile="$(results_file "$s" "$rb" "$bw")"
+            if [[ -n "${points[$outfile]}" ]]; then
+                echo "error: points ${points[$outfile]} and $k would both write $outfile" >&2
+                exit 1
+            fi
+            points[$outfile]=$k
+        done
+    done
+done
+
+if ((jobs > 1)); then
+    if [[ -n "${bw_grid[*]}" ]]; then
+        # set_rate.sh reloads the ifb module, which would clobber the other
+        # clusters' rate limits
+        echo "error: parallel jobs are not supported with upload bandwidths" >&2
+        exit 1
+    fi
+    # split this shard into `jobs` shards: points with index k + j*num_shards
+    # (mod jobs*num_shards) belong to job j
+    args=(-t "$test_num" -n "$num_nodes" -f "$file_cmd")
+    [[ -n "${strategy_grid[*]}" ]] && args+=(-s "$(IFS=,; echo "${strategy_grid[*]}")")
+    [[ -n "${rb_grid[*]}" ]] && args+=(-r "$(IFS=,; echo "${rb_grid[*]}")")
+    [[ -n "$results_dir" ]] && args+=(-d "$results_dir")
+    [[ -n "$list" ]] && args+=(-l)
+    iptb_root="${IPTB_ROOT:-$HOME/testbed}"
+    pids=()
+    for ((j=0; j < jobs; j++)); do
+        IPTB_ROOT="$iptb_root/job-$j" "$0" "${args[@]}" \
+            -S "$((shard + j * num_shards))/$((jobs * num_shards))" &
+        pids+=($!)
+    done
+    status=0
+    for pid in ${pids[@]}; do
+        wait $pid || status=1
+    done
+    exit $status
+fi
+
+# check that a results file is complete
+verify() {
+    [[ -s "$1" ]] &&
+    jq -e --argjson n "$num_nodes" \
+        'type == "array" and length == $n and all(.[]; has("id") and has("history"))' \
+        "$1" >/dev/null 2>&1
+}
+
+lock=""
+trap '[[ -n "$lock" ]] && rmdir "$lock"; exit 130' INT TERM
+
+k=-1
+failed=0
+for s in "${strategy_grid[@]}"; do
+    for rb in "${rb_grid[@]}"; do
+        for bw in "${bw_grid[@]}"; do
+            ((k++))
+            ((k % num_shards == shard)) || continue
+
+            outfile="$(results_file "$s" "$rb" "$bw")"
+            point="[$k] strategy='$s' round_burst='$rb' upload_bandwidth='$bw'"
+            if verify "$outfile"; then
+                echo "$point: done ($outfile)"
+                continue
+            elif [[ -n "$list" ]]; then
+                echo "$point: todo ($outfile)"
+                continue
+            fi
+
+            # don't run a point that another sweep is running
+            mkdir -p "$(dirname "$outfile")"
+            if ! mkdir "$outfile.lock" 2>/dev/null; then
+                echo "$point: locked (remove $outfile.lock if stale)"
+                continue
+            fi
+            lock="$outfile.lock"
+
+            echo "$point: running ($outfile)"
+            rm -f "$outfile"
+            args=(-t "$test_num" -n "$num_nodes" -f "$file_cmd" -d "$results_dir")
+            [[ -n "$s" ]] && args+=(-s "$s")
+            [[ -n "$rb" ]] && args+=(-r "$rb")
+            [[ -n "$bw" ]] && args+=(-b "$bw")
+            "$test_sh" "${args[@]}" >"${outfile%.json}.log" 2>&1
+            if verify "$outfile"; then
+                echo "$point: done ($outfile)"
+            else
+                echo "$point: failed (see ${outfile%.json}.log)" >&2
+                failed=1
+            fi
+
+            rmdir "$lock"
+            lock=""
+        done
+    done
+done
+
+exit $failed
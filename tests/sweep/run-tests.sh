@@ -0,0 +1,91 @@
+#!/bin/bash
+
+# Test sweep.sh against the real test.sh, with iptb, docker and sponge
+# replaced by the stubs in stubs/. Run from anywhere:
+#
+#   tests/sweep/run-tests.sh
+
+here="$(cd "$(dirname "$0")" && pwd)"
+root="$(cd "$here/../.." && pwd)"
+tmp="$(mktemp -d)"
+trap 'rm -rf "$tmp"' EXIT
+
+export PATH="$here/stubs:$PATH"
+export IPTB_ROOT="$tmp/testbed"
+export STUB_LOG="$tmp/calls"
+cd "$root"
+
+failed=0
+fail() {
+    echo "FAIL: $*" >&2
+    failed=1
+}
+
+# number of test.sh runs so far (each one creates an iptb cluster)
+runs() {
+    grep -c '^iptb auto' "$STUB_LOG" 2>/dev/null || echo 0
+}
+
+sweep() {
+    ./sweep.sh -t 2 -n 2 -f 'echo hi' -s identity,tanh -r 10,20 -d "$tmp/res" "$@"
+}
+
+# list: nothing is done yet, and nothing runs
+out="$(sweep -l)"
+(($(grep -c ': todo' <<< "$out") == 4)) || fail "list: expected 4 todo points: $out"
+(($(runs) == 0)) || fail "list: ran test.sh"
+
+# shard: only the even points run
+sweep -S 0/2 >/dev/null || fail "shard: exited with $?"
+(($(runs) == 2)) || fail "shard: expected 2 runs, got $(runs)"
+for f in identity-rb_10_10 tanh-rb_10_10; do
+    jq -e 'length == 2 and .[0].strategy != null' "$tmp/res/$f.json" >/dev/null ||
+        fail "shard: missing or invalid $f.json"
+done
+out="$(sweep -l)"
+(($(grep -c ': done' <<< "$out") == 2)) || fail "shard: expected 2 done points: $out"
+
+# resume: only the remaining points run
+sweep >/dev/null || fail "resume: exited with $?"
+(($(runs) == 4)) || fail "resume: expected 4 runs, got $(runs)"
+out="$(sweep -l)"
+(($(grep -c ': done' <<< "$out") == 4)) || fail "resume: expected 4 done points: $out"
+
+# an incomplete results file is rerun
+echo '[' > "$tmp/res/tanh-rb_20_20.json"
+sweep >/dev/null || fail "rerun: exited with $?"
+(($(runs) == 5)) || fail "rerun: expected 5 runs, got $(runs)"
+
+# parallel jobs get their own iptb clusters
+rm -rf "$tmp/res"
+sweep -j 2 >/dev/null || fail "jobs: exited with $?"
+(($(runs) == 9)) || fail "jobs: expected 9 runs, got $(runs)"
+for j in 0 1; do
+    (($(grep -c "^iptb auto .*IPTB_ROOT=$IPTB_ROOT/job-$j)" "$STUB_LOG") == 2)) ||
+        fail "jobs: expected 2 runs on job $j's cluster"
+done
+
+# a failing point is reported, and the sweep fails
+TEST_SH=false ./sweep.sh -t 2 -n 2 -f 'echo hi' -s identity -r 10 -d "$tmp/fail" \
+    >/dev/null 2>&1 && fail "failure: exited with 0"
+[[ -e "$tmp/fail/identity-rb_10_10.json.lock" ]] && fail "failure: lock left behind"
+
+# a locked point is skipped
+mkdir -p "$tmp/locked/identity-rb_10_10.json.lock"
+out="$(./sweep.sh -t 2 -n 2 -f 'echo hi' -s identity -r 10 -d "$tmp/locked")"
+grep -q ': locked' <<< "$out" || fail "lock: point wasn't skipped: $out"
+
+# grids that test.sh can't run are rejected
+./sweep.sh -t 2 -n 2 -f 'echo hi' -s identity -d "$tmp/res" -l >/dev/null 2>&1 &&
+    fail "grid: -s without -r was accepted"
+
+# points that would share a results file are rejected
+./sweep.sh -t 2 -n 2 -f 'echo hi' -r 10,20 -d "$tmp/res" -l >/dev/null 2>&1 &&
+    fail "collision: -r without -s was accepted"
+./sweep.sh -t 2 -n 2 -f 'echo hi' -s 'identity,identity tanh' -r 10 -d "$tmp/res" \
+    -l >/dev/null 2>&1 && fail "collision: strategies with the same first node were accepted"
+
+if ((failed)); then
+    exit 1
+fi
+echo "all sweep tests passed"